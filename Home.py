@@ -1,9 +1,11 @@
 import streamlit as st
+from utils.tokens import prewarm
 
 st.set_page_config(
     page_title="FullstackGPT Home",
     page_icon="🤖",
 )
+prewarm()
 
 st.markdown(
     """
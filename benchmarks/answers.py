@@ -0,0 +1,89 @@
+"""Latency of SiteGPT's per-doc answer step, sequential against batch().
+
+    python -m benchmarks.answers [--docs 4 8 20] [--delay 0.5] [--fail-rate 0.1]
+
+The chat model is a stub that sleeps ``--delay`` seconds (plus up to 20%
+jitter) per call and raises for ``--fail-rate`` of them, so the numbers
+only measure how the map step schedules calls. "sequential" is the old
+one-invoke-per-doc list comprehension; "batch" is get_answers' batch() with
+ANSWERS_MAX_CONCURRENCY and return_exceptions.
+"""
+import argparse
+import random
+import time
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.prompts import ChatPromptTemplate
+
+# Same as pages/SiteGPT.py, which can't be imported outside `streamlit run`
+ANSWERS_MAX_CONCURRENCY = 8
+
+prompt = ChatPromptTemplate.from_template(
+    "Using ONLY the following context answer the question, then score it "
+    "between 0 and 5.\n\nContext: {context}\n\nQuestion: {question}"
+)
+
+
+class SlowChatModel(BaseChatModel):
+    delay: float = 0.5
+    fail_rate: float = 0.0
+    seed: int = 0
+
+    @property
+    def _llm_type(self):
+        return "slow-stub"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        rng = random.Random(f"{self.seed}:{messages[-1].content}")
+        time.sleep(self.delay * rng.uniform(1.0, 1.2))
+        if rng.random() < self.fail_rate:
+            raise TimeoutError("stubbed request timeout")
+        message = AIMessage(content="The answer.\nScore: 4")
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def sequential(chain, inputs):
+    answers = []
+    for item in inputs:
+        try:
+            answers.append(chain.invoke(item))
+        except Exception:
+            pass
+    return answers
+
+
+def batched(chain, inputs):
+    results = chain.batch(
+        inputs,
+        config={"max_concurrency": ANSWERS_MAX_CONCURRENCY},
+        return_exceptions=True,
+    )
+    return [result for result in results if not isinstance(result, Exception)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, nargs="+", default=[4, 8, 20])
+    parser.add_argument("--delay", type=float, default=0.5)
+    parser.add_argument("--fail-rate", type=float, default=0.1)
+    args = parser.parse_args()
+
+    chain = prompt | SlowChatModel(delay=args.delay, fail_rate=args.fail_rate)
+    print(f"{'docs':>5} {'map step':12} {'seconds':>8} {'answers':>8} {'x call':>6}")
+    for count in args.docs:
+        inputs = [
+            {"context": f"Page {i} of the site.", "question": "How far is the moon?"}
+            for i in range(count)
+        ]
+        for name, run in (("sequential", sequential), ("batch", batched)):
+            start = time.perf_counter()
+            answers = run(chain, inputs)
+            elapsed = time.perf_counter() - start
+            calls = elapsed / args.delay
+            print(f"{count:5} {name:12} {elapsed:8.2f} {len(answers):8} {calls:6.1f}")
+
+
+if __name__ == "__main__":
+    main()
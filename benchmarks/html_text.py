@@ -0,0 +1,119 @@
+"""Pages per second of the selectolax and BeautifulSoup text extractors.
+
+    python -m benchmarks.html_text [--paragraphs 2000] [--seconds 1]
+        [--pages-db .cache/pages.db]
+
+The corpus is the saved pages in benchmarks/data/html plus one synthetic
+page of ``--paragraphs`` paragraphs, with the header, nav, footer, script
+and style a real site wraps around them. ``--pages-db`` adds every page a
+SiteGPT crawl stored in its PageStore. "text" is SiteGPT's parse_page call,
+which drops the first header and footer; "paragraphs" is what the
+OpenAIAgent scraping tools read. The last column checks that both
+extractors produce the same words, so a faster parse never means a
+different document.
+"""
+import argparse
+import random
+import sqlite3
+import time
+import zlib
+from pathlib import Path
+
+from utils.html_text import LexborHTMLParser, SelectolaxExtractor, SoupExtractor
+
+DATA = Path(__file__).parent / "data" / "html"
+
+WORDS = (
+    "the moon orbit tide earth rotation day month angular momentum ocean "
+    "bulge laser reflector distance centimetre year friction energy gravity"
+).split()
+
+
+def synthetic_page(paragraphs, seed=0):
+    rng = random.Random(seed)
+    body = "\n".join(
+        f"<p>{' '.join(rng.choices(WORDS, k=rng.randint(20, 60)))}.</p>"
+        for _ in range(paragraphs)
+    )
+    return (
+        "<html><head><style>p { margin: 0 }</style>"
+        "<script>var seen = {}; function track(e) { seen[e] = 1; }</script></head>"
+        "<body><header><nav><a href='/'>Home</a> <a href='/docs'>Docs</a></nav>"
+        f"</header><main>{body}</main>"
+        "<footer><p>&copy; 2026 Example</p></footer>"
+        "<script>track('page');</script></body></html>"
+    )
+
+
+def load_pages_db(path):
+    with sqlite3.connect(path) as conn:
+        rows = conn.execute("SELECT html FROM pages").fetchall()
+    return [zlib.decompress(html).decode() for html, in rows]
+
+
+def throughput(extract, pages, seconds):
+    # Whole passes over the pages until at least ``seconds`` have gone by
+    passes = 0
+    start = time.perf_counter()
+    while True:
+        for html in pages:
+            extract(html)
+        passes += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return passes * len(pages) / elapsed
+
+
+def words(result):
+    if isinstance(result, list):
+        result = " ".join(result)
+    return result.split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--paragraphs", type=int, default=2000)
+    parser.add_argument("--seconds", type=float, default=1.0)
+    parser.add_argument("--pages-db", type=Path)
+    args = parser.parse_args()
+
+    if LexborHTMLParser is None:
+        parser.error("selectolax is not installed")
+    corpora = {"saved": [path.read_text() for path in sorted(DATA.glob("*.html"))]}
+    if args.pages_db:
+        corpora["pages.db"] = load_pages_db(args.pages_db)
+    corpora[f"{args.paragraphs} paragraphs"] = [synthetic_page(args.paragraphs)]
+
+    extractors = {"selectolax": SelectolaxExtractor(), "bs4": SoupExtractor()}
+    calls = {
+        "text": lambda extractor, html: extractor.text(html, ("header", "footer")),
+        "paragraphs": lambda extractor, html: extractor.paragraphs(html),
+    }
+    print(
+        f"{'corpus':16} {'pages':>5} {'KB':>7} {'call':10} "
+        f"{'selectolax/s':>12} {'bs4/s':>9} {'speedup':>8} {'same words':>10}"
+    )
+    for name, pages in corpora.items():
+        size = sum(len(html) for html in pages) / 1024
+        for call_name, call in calls.items():
+            rates = {
+                extractor_name: throughput(
+                    lambda html: call(extractor, html), pages, args.seconds
+                )
+                for extractor_name, extractor in extractors.items()
+            }
+            same = all(
+                words(call(extractors["selectolax"], html))
+                == words(call(extractors["bs4"], html))
+                for html in pages
+            )
+            speedup = rates["selectolax"] / rates["bs4"]
+            print(
+                f"{name:16} {len(pages):5} {size:7.1f} {call_name:10} "
+                f"{rates['selectolax']:12.1f} {rates['bs4']:9.1f} "
+                f"{speedup:7.1f}x {'yes' if same else 'NO':>10}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Cold-start import cost of each page, failing when one is over its budget.
+
+    python -m benchmarks.importtime [--budget-ms 1500] [--runs 3] [PAGE ...]
+
+Every run executes a page's module-level imports in a fresh interpreter and
+times them. Streamlit itself is imported before the clock starts, since the
+server has already loaded it when a page first runs. The best of ``--runs``
+is compared against the budget, and the heaviest imports are listed so a
+regression can be traced to the module that caused it. Exits 1 when any
+page is over budget.
+"""
+import argparse
+import ast
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+PAGES = [ROOT / "Home.py", *sorted((ROOT / "pages").glob("*.py"))]
+PRELOADED = ("streamlit",)
+
+# Milliseconds, with headroom over a warm-disk run of the lazy-import pages
+DEFAULT_BUDGET_MS = 1500
+BUDGETS_MS = {
+    "Home": 300,
+}
+
+CHILD = """
+import importlib, sys, time
+for name in {preloaded!r}:
+    try:
+        importlib.import_module(name)
+    except ImportError:
+        pass
+print({marker!r}, file=sys.stderr, flush=True)
+start = time.perf_counter()
+exec(compile({source!r}, {page!r}, "exec"), {{"__name__": "__importtime__"}})
+print(time.perf_counter() - start)
+"""
+
+MARKER = "-- page imports --"
+IMPORTTIME_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def top_level_imports(path):
+    """The page's import statements that run on import, not inside functions."""
+    statements = []
+
+    def visit(nodes):
+        for node in nodes:
+            if isinstance(node, (ast.Import, ast.ImportFrom)):
+                statements.append(ast.unparse(node))
+            elif not isinstance(
+                node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+            ):
+                for field in ("body", "orelse", "finalbody", "handlers"):
+                    visit(getattr(node, field, []))
+
+    visit(ast.parse(path.read_text()).body)
+    return "\n".join(statements)
+
+
+def heaviest(stderr, count=5):
+    # Cumulative time of the imports made by the page itself (least indented)
+    entries = [
+        (int(cumulative), len(indent), name)
+        for _, cumulative, indent, name in IMPORTTIME_RE.findall(
+            stderr.partition(MARKER)[2]
+        )
+    ]
+    if not entries:
+        return []
+    top = min(indent for _, indent, _ in entries)
+    return sorted(
+        ((cumulative, name) for cumulative, indent, name in entries if indent == top),
+        reverse=True,
+    )[:count]
+
+
+def measure(path):
+    source = top_level_imports(path)
+    child = CHILD.format(
+        preloaded=PRELOADED, marker=MARKER, source=source, page=str(path)
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", child],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return float(result.stdout) * 1000, heaviest(result.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pages", nargs="*", help="page names, default all")
+    parser.add_argument("--budget-ms", type=float, help="one budget for every page")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    pages = [path for path in PAGES if not args.pages or path.stem in args.pages]
+    failed = False
+    for path in pages:
+        budget = args.budget_ms or BUDGETS_MS.get(path.stem, DEFAULT_BUDGET_MS)
+        try:
+            elapsed, imports = min(measure(path) for _ in range(args.runs))
+        except RuntimeError as e:
+            print(f"{path.stem:14} ERROR {e}")
+            failed = True
+            continue
+        over = elapsed > budget
+        failed |= over
+        print(
+            f"{path.stem:14} {elapsed:8.1f} ms  budget {budget:6.0f} ms"
+            f"  {'OVER' if over else 'ok'}"
+        )
+        for cumulative, name in imports:
+            print(f"{'':16}{cumulative / 1000:8.1f} ms  {name}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
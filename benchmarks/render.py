@@ -0,0 +1,135 @@
+"""Renders and bytes sent while streaming an answer, StreamRenderer against a
+redraw on every token.
+
+    python -m benchmarks.render [--tokens 2000] [--rates 0 50 200] [--interval 0.1]
+
+The container is a stand-in for st.container() that counts markdown() calls
+and the bytes each one sends, which is what a Streamlit rerender costs over
+the websocket. Tokens arrive at each of ``--rates`` per second on a
+simulated clock, so the run is instant and repeatable. A rate of 0 delivers
+the whole answer at once, leaving ``max_pending`` as the only trigger. The
+answer mixes prose paragraphs with a fenced code block that contains blank
+lines, and the last column checks that the elements left on screen join
+back to exactly the streamed text.
+"""
+import argparse
+import random
+import re
+
+from utils import render
+from utils.render import StreamRenderer
+
+WORDS = (
+    "the index stores each chunk once and every query reads the same vectors "
+    "so a cold start only pays for loading what it needs"
+).split()
+
+
+class Box:
+    def __init__(self, container):
+        self.container = container
+        self.text = ""
+
+    def markdown(self, text):
+        self.text = text
+        self.container.renders += 1
+        self.container.bytes_sent += len(text.encode())
+
+
+class Container:
+    def __init__(self):
+        self.boxes = []
+        self.renders = 0
+        self.bytes_sent = 0
+
+    def empty(self):
+        box = Box(self)
+        self.boxes.append(box)
+        return box
+
+    def shown(self):
+        return "".join(box.text for box in self.boxes)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+
+def answer_tokens(count, seed=0):
+    rng = random.Random(seed)
+    parts = []
+    while sum(len(re.findall(r"\s*\S+", part)) for part in parts) < count:
+        if rng.random() < 0.15:
+            parts.append(
+                "```python\ndef load(key):\n    path = index_path(key)\n\n"
+                "    return read_index(path)\n```"
+            )
+        else:
+            sentences = (
+                " ".join(rng.choices(WORDS, k=rng.randint(8, 20))).capitalize() + "."
+                for _ in range(rng.randint(2, 5))
+            )
+            parts.append(" ".join(sentences))
+    return re.findall(r"\s*\S+", "\n\n".join(parts))[:count]
+
+
+def every_token(container, tokens, clock, rate):
+    box = container.empty()
+    text = ""
+    for token in tokens:
+        clock.now += 1 / rate if rate else 0
+        text += token
+        box.markdown(text)
+
+
+def stream_renderer(container, tokens, clock, rate, interval):
+    renderer = StreamRenderer(container, interval=interval)
+    for token in tokens:
+        clock.now += 1 / rate if rate else 0
+        renderer.append(token)
+    renderer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=2000)
+    parser.add_argument(
+        "--rates", type=float, nargs="+", default=[0, 50, 200], help="tokens per second"
+    )
+    parser.add_argument("--interval", type=float, default=0.1)
+    args = parser.parse_args()
+
+    tokens = answer_tokens(args.tokens)
+    text = "".join(tokens)
+    clock = Clock()
+    render.time = clock
+    print(f"{len(tokens)} tokens, {len(text.encode()) / 1024:.1f} KB")
+    print(
+        f"{'tokens/s':>8} {'renderer':16} {'renders':>8} {'KB sent':>9} "
+        f"{'elements':>9} {'same text':>9}"
+    )
+    for rate in args.rates:
+        runs = {
+            "every token": lambda c: every_token(c, tokens, clock, rate),
+            "StreamRenderer": lambda c: stream_renderer(
+                c, tokens, clock, rate, args.interval
+            ),
+        }
+        for name, run in runs.items():
+            container = Container()
+            run(container)
+            same = container.shown() == text
+            speed = f"{rate:g}" if rate else "burst"
+            print(
+                f"{speed:>8} {name:16} {container.renders:8} "
+                f"{container.bytes_sent / 1024:9.1f} {len(container.boxes):9} "
+                f"{'yes' if same else 'NO':>9}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Recall@k and p50/p99 latency of BM25, vector and hybrid retrieval.
+
+    python -m benchmarks.retrieval [--k 4] [--distractors 5000]
+        [--embed-delay 0.5] [--openai]
+
+Queries and their relevant documents come from benchmarks/data/retrieval.json:
+exact terms (error codes, API and header names) alongside paraphrased
+questions. ``--distractors`` pads the corpus with filler documents drawn
+from the same vocabulary, so latencies reflect a realistically sized index.
+
+Vectors come from a hashed character-trigram embedding, a deterministic
+offline stand-in, unless ``--openai`` embeds with cached_embeddings and
+OPENAI_API_KEY. ``--embed-delay`` adds latency to every query embedding to
+show the lexical fast path: the first query waits for vector_timeout, and
+the following ones answer from BM25 alone.
+"""
+import argparse
+import json
+import os
+import random
+import time
+import zlib
+from pathlib import Path
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from utils import vector_index
+from utils.hybrid import BM25Index, HybridRetriever
+
+DATA = Path(__file__).parent / "data" / "retrieval.json"
+
+
+class HashedEmbeddings(Embeddings):
+    def __init__(self, dim=512):
+        self.dim = dim
+
+    def _embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        text = f" {' '.join(text.lower().split())} "
+        for i in range(len(text) - 2):
+            vector[zlib.crc32(text[i : i + 3].encode()) % self.dim] += 1
+        return (vector / (np.linalg.norm(vector) or 1)).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+class DelayedEmbeddings(Embeddings):
+    def __init__(self, embeddings, delay):
+        self.embeddings = embeddings
+        self.delay = delay
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        time.sleep(self.delay)
+        return self.embeddings.embed_query(text)
+
+
+def load_corpus(distractors, seed=0):
+    with open(DATA) as f:
+        data = json.load(f)
+    docs = [(doc["id"], doc["text"]) for doc in data["docs"]]
+    rng = random.Random(seed)
+    words = " ".join(text for _, text in docs).split()
+    for i in range(distractors):
+        text = " ".join(rng.choices(words, k=rng.randint(30, 60)))
+        docs.append((f"filler-{i}", text))
+    return docs, data["queries"]
+
+
+def evaluate(name, search, queries, k):
+    latencies, recalls = [], []
+    for query in queries:
+        start = time.perf_counter()
+        ids = search(query["query"])[:k]
+        latencies.append(time.perf_counter() - start)
+        relevant = set(query["relevant"])
+        recalls.append(len(relevant & set(ids)) / len(relevant))
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+    print(f"{name:24} {np.mean(recalls):10.3f} {p50:9.3f} {p99:9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--distractors", type=int, default=5000)
+    parser.add_argument("--embed-delay", type=float, default=0.5)
+    parser.add_argument("--vector-timeout", type=float, default=0.2)
+    parser.add_argument("--openai", action="store_true")
+    args = parser.parse_args()
+
+    if args.openai:
+        from utils.embeddings import cached_embeddings
+
+        embeddings = cached_embeddings(os.environ["OPENAI_API_KEY"])
+    else:
+        embeddings = HashedEmbeddings()
+    docs, queries = load_corpus(args.distractors)
+    ids = [doc_id for doc_id, _ in docs]
+    vectorstore = vector_index.build(
+        [Document(page_content=text) for _, text in docs], embeddings, ids
+    )
+    lexical = BM25Index()
+    lexical.add(ids, [text for _, text in docs])
+    retriever = HybridRetriever(vectorstore=vectorstore, lexical=lexical, k=args.k)
+
+    print(
+        f"{len(docs)} docs, {len(queries)} queries, "
+        f"{vector_index.index_kind(vectorstore.index)} index"
+    )
+    print(f"{'retriever':24} {f'recall@{args.k}':>10} {'p50 ms':>9} {'p99 ms':>9}")
+    evaluate(
+        "bm25",
+        lambda q: [doc_id for doc_id, _ in lexical.search(q, args.k)],
+        queries,
+        args.k,
+    )
+    evaluate(
+        "vector",
+        lambda q: [doc.id for doc in vectorstore.similarity_search(q, k=args.k)],
+        queries,
+        args.k,
+    )
+    evaluate(
+        "hybrid",
+        lambda q: [doc.id for doc in retriever.invoke(q)],
+        queries,
+        args.k,
+    )
+    if args.embed_delay:
+        slow = retriever.with_embeddings(
+            DelayedEmbeddings(embeddings, args.embed_delay)
+        )
+        slow.vector_timeout = args.vector_timeout
+        evaluate(
+            f"hybrid, +{args.embed_delay:g}s embed",
+            lambda q: [doc.id for doc in slow.invoke(q)],
+            queries,
+            args.k,
+        )
+
+
+if __name__ == "__main__":
+    main()
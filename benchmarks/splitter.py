@@ -0,0 +1,102 @@
+"""Splitting throughput of TokenSplitter against the tiktoken splitters it replaced.
+
+    python -m benchmarks.splitter [--mb 4] [--file corpus.txt]
+
+The corpus is generated from a fixed seed unless ``--file`` is given.
+"""
+import argparse
+import logging
+import random
+import time
+
+from langchain_text_splitters import (
+    CharacterTextSplitter,
+    RecursiveCharacterTextSplitter,
+)
+
+from utils.splitter import TokenSplitter
+from utils.tokens import (
+    DEFAULT_ENCODING,
+    count_tokens,
+    encode_with_offsets,
+    get_encoding,
+)
+
+
+def synthetic_corpus(size, seed=0):
+    rng = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = [
+        "".join(rng.choices(letters, k=rng.randint(2, 10))) for _ in range(5000)
+    ]
+    lines, length = [], 0
+    while length < size:
+        sentences = [
+            " ".join(rng.choices(words, k=rng.randint(5, 25))).capitalize() + "."
+            for _ in range(rng.randint(1, 6))
+        ]
+        line = " ".join(sentences)
+        # Blank lines between paragraphs, as extracted pages have them
+        lines.append(line + ("\n" if rng.random() < 0.3 else ""))
+        length += len(line) + 1
+    return "\n".join(lines)
+
+
+def splitters():
+    # The settings DocumentGPT/QuizGPT and SiteGPT split with
+    return [
+        (
+            "CharacterTextSplitter 600/100",
+            CharacterTextSplitter.from_tiktoken_encoder(
+                encoding_name=DEFAULT_ENCODING,
+                separator="\n",
+                chunk_size=600,
+                chunk_overlap=100,
+            ),
+        ),
+        (
+            "TokenSplitter 600/100",
+            TokenSplitter(separators=["\n"], chunk_size=600, chunk_overlap=100),
+        ),
+        (
+            "RecursiveCharacterTextSplitter 1000/200",
+            RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+                encoding_name=DEFAULT_ENCODING, chunk_size=1000, chunk_overlap=200
+            ),
+        ),
+        ("TokenSplitter 1000/200", TokenSplitter(chunk_size=1000, chunk_overlap=200)),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mb", type=float, default=4)
+    parser.add_argument("--file")
+    args = parser.parse_args()
+    # The character splitters warn about every chunk over chunk_size
+    logging.getLogger("langchain_text_splitters").setLevel(logging.ERROR)
+
+    if args.file:
+        with open(args.file) as f:
+            text = f.read()
+    else:
+        text = synthetic_corpus(int(args.mb * 1024 * 1024))
+    encoding = get_encoding()
+    mb = len(text.encode()) / 1024 / 1024
+    print(f"corpus: {mb:.1f} MB, {len(encoding.encode(text)):,} tokens")
+    print(f"{'splitter':42} {'seconds':>8} {'MB/s':>7} {'chunks':>7} {'max tok':>8}")
+    # The offset table is built once per process, like the encoding itself
+    encode_with_offsets("warm up")
+    for name, splitter in splitters():
+        count_tokens.cache_clear()
+        start = time.perf_counter()
+        chunks = splitter.split_text(text)
+        elapsed = time.perf_counter() - start
+        longest = max(len(encoding.encode(chunk)) for chunk in chunks)
+        print(
+            f"{name:42} {elapsed:8.2f} {mb / elapsed:7.2f} {len(chunks):7} {longest:8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
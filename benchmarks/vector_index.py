@@ -0,0 +1,108 @@
+"""Build time, memory, recall@10 and query latency of the FAISS index tiers.
+
+    python -m benchmarks.vector_index [--sizes 10000 100000 300000] [--dim 256]
+        [--all-specs] [--hnsw]
+
+Vectors are synthetic: Gaussian clusters from a fixed seed, with queries
+drawn from the same clusters. Recall is measured against exact search. By
+default each size only gets the spec utils.vector_index picks for it;
+``--all-specs`` compares every tier at every size. The remove column is the
+time to delete 1% of the vectors in place, or "rebuild" for HNSW.
+"""
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from utils.vector_index import HNSW_M, index_spec, ivf_spec, spec_kind, tune
+
+
+def synthetic(count, dim, clusters=256, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    spread = rng.uniform(0.3, 1.0, clusters).astype(np.float32)[:, None]
+
+    def draw(n):
+        assignment = rng.integers(0, clusters, n)
+        noise = rng.standard_normal((n, dim), dtype=np.float32)
+        return centers[assignment] + noise * spread[assignment]
+
+    return draw(count), draw
+
+
+def specs_for(count, dim, all_specs, hnsw):
+    if not all_specs:
+        specs = [index_spec(count, dim)]
+        if hnsw:
+            specs.append(index_spec(count, dim, hnsw=True))
+        return list(dict.fromkeys(specs))
+    return ["Flat", "SQfp16", ivf_spec(count, dim), f"HNSW{HNSW_M},SQfp16"]
+
+
+def measure(spec, vectors, queries, truth, k):
+    start = time.perf_counter()
+    index = faiss.index_factory(vectors.shape[1], spec)
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    tune(index)
+    build = time.perf_counter() - start
+    size = len(faiss.serialize_index(index))
+
+    latencies = []
+    found = []
+    for query in queries:
+        start = time.perf_counter()
+        _, labels = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - start)
+        found.append(labels[0])
+    recall = np.mean(
+        [len(set(row) & set(expected)) / k for row, expected in zip(found, truth)]
+    )
+
+    if spec_kind(spec) == "HNSW":
+        remove = "rebuild"
+    else:
+        doomed = np.arange(0, len(vectors), 100, dtype=np.int64)
+        start = time.perf_counter()
+        index.remove_ids(doomed)
+        remove = f"{(time.perf_counter() - start) * 1000:.0f} ms"
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+    return build, size, recall, p50, p99, remove
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10_000, 100_000, 300_000]
+    )
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--all-specs", action="store_true")
+    parser.add_argument("--hnsw", action="store_true")
+    args = parser.parse_args()
+
+    print(
+        f"{'vectors':>8} {'spec':22} {'build s':>8} {'MB':>8} "
+        f"{f'recall@{args.k}':>10} {'p50 ms':>7} {'p99 ms':>7} {'remove 1%':>10}"
+    )
+    for count in args.sizes:
+        vectors, draw = synthetic(count, args.dim)
+        queries = draw(args.queries)
+        exact = faiss.IndexFlatL2(args.dim)
+        exact.add(vectors)
+        _, truth = exact.search(queries, args.k)
+        for spec in specs_for(count, args.dim, args.all_specs, args.hnsw):
+            build, size, recall, p50, p99, remove = measure(
+                spec, vectors, queries, truth, args.k
+            )
+            print(
+                f"{count:8} {spec:22} {build:8.2f} {size / 1024**2:8.1f} "
+                f"{recall:10.3f} {p50:7.3f} {p99:7.3f} {remove:>10}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,65 +1,115 @@
 import streamlit as st
-from langchain.document_loaders import UnstructuredFileLoader
-from langchain.embeddings import CacheBackedEmbeddings, OpenAIEmbeddings
-from langchain.storage import LocalFileStore
-from langchain.text_splitter import CharacterTextSplitter
-from langchain.vectorstores.faiss import FAISS
-from langchain.chat_models import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
-from langchain.schema.runnable import RunnableLambda, RunnablePassthrough
 from langchain.callbacks.base import BaseCallbackHandler
 from pathlib import Path
+from utils.context import pack_context, usage_log
+from utils.index_store import (
+    content_key,
+    has_index,
+    load_index,
+    load_lexical,
+    save_index,
+)
+from utils.registry import chat_model, shared
+from utils.render import StreamRenderer
+from utils.tokens import prewarm
 
 st.set_page_config(
     page_title="Assignment #15",
     page_icon="📜",
 )
+prewarm()
 
 
 class ChatCallbackHandler(BaseCallbackHandler):
-    message = ""
-
     def on_llm_start(self, *args, **kwargs):
-        self.message_box = st.empty()
+        self.renderer = StreamRenderer(st.container())
 
-    def on_llm_end(self, *args, **kwargs):
-        save_message(self.message, "ai")
+    def on_llm_end(self, response, *args, **kwargs):
+        message = self.renderer.close(response.generations[0][0].text)
+        save_message(message, "ai")
 
     def on_llm_new_token(self, token, *args, **kwargs):
-        self.message += token
-        self.message_box.markdown(self.message)
+        self.renderer.append(token)
 
 
 if "messages" not in st.session_state:
     st.session_state["messages"] = []
 
+SPLITTER_SETTINGS = {
+    "separators": ["\n"],
+    "chunk_size": 600,
+    "chunk_overlap": 100,
+}
+
 
-@st.cache_data(show_spinner="Embedding file...")
 def embed_file(file):
-    file_content = file.read()
-    file_path = f"./.cache/files/{file.name}"
+    file_content = file.getvalue()
+    key = content_key(file_content, SPLITTER_SETTINGS)
+    # One retriever per file and API key, shared by every session
+    return shared(
+        "retriever",
+        {"index": key, "k": 8},
+        lambda: build_retriever(key, file_content, Path(file.name).suffix),
+        api_key=openai_api_key,
+    )
+
+
+def build_retriever(key, file_content, suffix):
+    import uuid
+    from utils import vector_index
+    from utils.embeddings import cached_embeddings
+    from utils.hybrid import BM25Index, HybridRetriever
+    from utils.loaders import stream_chunks
+
+    if has_index(key):
+        vectorstore = load_index(key, cached_embeddings(openai_api_key))
+        return HybridRetriever(
+            vectorstore=vectorstore, lexical=load_lexical(key, vectorstore), k=8
+        )
+
+    file_path = f"./.cache/files/{key}{suffix}"
     Path("./.cache/files").mkdir(parents=True, exist_ok=True)
     with open(file_path, "wb+") as f:
         f.write(file_content)
-    cache_dir = LocalFileStore(f"./.cache/embeddings/{file.name}")
-    splitter = CharacterTextSplitter.from_tiktoken_encoder(
-        separator="\n",
-        chunk_size=600,
-        chunk_overlap=100,
-    )
-    loader = UnstructuredFileLoader(f"{file_path}")
-    docs = loader.load_and_split(text_splitter=splitter)
-    embeddings = OpenAIEmbeddings(
-        openai_api_key=openai_api_key,
+    progress = st.progress(0.0, text="Embedding chunks...")
+    embeddings = cached_embeddings(
+        openai_api_key,
+        on_progress=lambda done, total: progress.progress(
+            done / total, text=f"Embedding chunks... ({done}/{total})"
+        ),
     )
-    cached_embeddings = CacheBackedEmbeddings.from_bytes_store(embeddings, cache_dir)
-    vectorstore = FAISS.from_documents(docs, cached_embeddings)
-    retriever = vectorstore.as_retriever()
-    return retriever
+    # Embed each page range as soon as it is parsed instead of waiting for the whole file
+    vectorstore = None
+    lexical = BM25Index()
+    for docs in stream_chunks(file_path, SPLITTER_SETTINGS):
+        if not docs:
+            continue
+        ids = [str(uuid.uuid4()) for _ in docs]
+        lexical.add(ids, [doc.page_content for doc in docs])
+        if vectorstore is None:
+            vectorstore = vector_index.build(docs, embeddings, ids)
+        else:
+            vectorstore = vector_index.add(vectorstore, docs, ids)
+    if vectorstore is None:
+        progress.empty()
+        raise ValueError(f"No text could be extracted from {Path(file_path).name}")
+    # Sized from the first page range, so pick the index type for the whole file
+    vectorstore = vector_index.fit(vectorstore)
+    progress.empty()
+    save_index(key, vectorstore, lexical=lexical)
+    # Fetch more than fits and let pack_docs pack the budget by relevance
+    return HybridRetriever(vectorstore=vectorstore, lexical=lexical, k=8)
+
+
+# Only the most recent messages are kept, so long chats don't slow every rerun
+MAX_MESSAGES = 50
 
 
 def save_message(message, role):
-    st.session_state["messages"].append({"message": message, "role": role})
+    messages = st.session_state["messages"]
+    messages.append({"message": message, "role": role})
+    del messages[:-MAX_MESSAGES]
 
 
 def send_message(message, role, save=True):
@@ -74,8 +124,18 @@ def paint_history():
         send_message(message["message"], message["role"], save=False)
 
 
-def format_docs(docs):
-    return "\n\n".join(document.page_content for document in docs)
+CONTEXT_TOKEN_BUDGET = 3000
+
+
+def pack_docs(docs):
+    context = pack_context(docs, CONTEXT_TOKEN_BUDGET)
+    usage_log.info(
+        "DocumentGPT context: %d tokens from %d/%d chunks",
+        context.tokens,
+        len(context.docs),
+        len(docs),
+    )
+    return context
 
 
 prompt = ChatPromptTemplate.from_messages(
@@ -97,14 +157,7 @@ def main():
     if not openai_api_key:
         return
 
-    llm = ChatOpenAI(
-        temperature=0.1,
-        streaming=True,
-        openai_api_key=openai_api_key,
-        callbacks=[
-            ChatCallbackHandler(),
-        ],
-    )
+    llm = chat_model(openai_api_key, temperature=0.1, streaming=True)
 
     if file:
         retriever = embed_file(file)
@@ -114,16 +167,16 @@ def main():
         message = st.chat_input("Ask anything about your file.....")
         if message:
             send_message(message, "human")
-            chain = (
-                {
-                    "context": retriever | RunnableLambda(format_docs),
-                    "question": RunnablePassthrough(),
-                }
-                | prompt
-                | llm
-            )
+            context = pack_docs(retriever.invoke(message))
+            chain = prompt | llm
             with st.chat_message("ai"):
-                chain.invoke(message)
+                chain.invoke(
+                    {"context": context.text, "question": message},
+                    config={"callbacks": [ChatCallbackHandler()]},
+                )
+                st.caption(
+                    f"Context: {context.tokens} tokens from {len(context.docs)} chunks"
+                )
 
     else:
         st.session_state["messages"] = []
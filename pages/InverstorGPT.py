@@ -1,17 +1,8 @@
-from langchain.schema import SystemMessage
 import streamlit as st
-import os
-import requests
 from typing import Type
-from langchain.chat_models import ChatOpenAI
 from langchain.tools import BaseTool
 from pydantic import BaseModel, Field
-from langchain.agents import initialize_agent, AgentType
-from langchain.utilities import DuckDuckGoSearchAPIWrapper
-
-llm = ChatOpenAI(temperature=0.1, model_name="gpt-3.5-turbo-1106")
-
-alpha_vantage_api_key = os.environ.get("ALPHA_VANTAGE_API_KEY")
+from utils.tool_cache import tool_cache
 
 
 class StockMarketSymbolSearchToolArgsSchema(BaseModel):
@@ -32,8 +23,17 @@ class StockMarketSymbolSearchTool(BaseTool):
     ] = StockMarketSymbolSearchToolArgsSchema
 
     def _run(self, query):
+        from langchain.utilities import DuckDuckGoSearchAPIWrapper
+
         ddg = DuckDuckGoSearchAPIWrapper()
-        return ddg.run(query)
+        # Ticker symbols practically never change
+        return tool_cache().call(
+            self.name,
+            {"query": query},
+            ttl=7 * 24 * 60 * 60,
+            fn=lambda: ddg.run(query),
+            ignore_case=True,
+        )
 
 
 class CompanyOverviewArgsSchema(BaseModel):
@@ -51,10 +51,9 @@ class CompanyOverviewTool(BaseTool):
     args_schema: Type[CompanyOverviewArgsSchema] = CompanyOverviewArgsSchema
 
     def _run(self, symbol):
-        r = requests.get(
-            f"https://www.alphavantage.co/query?function=OVERVIEW&symbol={symbol}&apikey={alpha_vantage_api_key}"
-        )
-        return r.json()
+        from utils.market_data import compact, market_data, overview_summary
+
+        return compact(overview_summary(market_data().overview(symbol)))
 
 
 class CompanyIncomeStatementTool(BaseTool):
@@ -66,10 +65,20 @@ class CompanyIncomeStatementTool(BaseTool):
     args_schema: Type[CompanyOverviewArgsSchema] = CompanyOverviewArgsSchema
 
     def _run(self, symbol):
-        r = requests.get(
-            f"https://www.alphavantage.co/query?function=INCOME_STATEMENT&symbol={symbol}&apikey={alpha_vantage_api_key}"
+        from utils.market_data import (
+            compact,
+            income_summary,
+            income_table,
+            market_data,
+        )
+
+        store = market_data()
+        annual = store.income(symbol, "annual")
+        quarterly = store.income(symbol, "quarterly")
+        return compact(
+            income_summary(annual, quarterly),
+            [income_table(annual), income_table(quarterly, rows=4, lag=4)],
         )
-        return r.json()["annualReports"]
 
 
 class CompanyStockPerformanceTool(BaseTool):
@@ -81,27 +90,36 @@ class CompanyStockPerformanceTool(BaseTool):
     args_schema: Type[CompanyOverviewArgsSchema] = CompanyOverviewArgsSchema
 
     def _run(self, symbol):
-        r = requests.get(
-            f"https://www.alphavantage.co/query?function=TIME_SERIES_WEEKLY&symbol={symbol}&apikey={alpha_vantage_api_key}"
-        )
-        response = r.json()
-        return list(response["Weekly Time Series"].items())[:200]
-
-
-agent = initialize_agent(
-    llm=llm,
-    verbose=True,
-    agent=AgentType.OPENAI_FUNCTIONS,
-    handle_parsing_errors=True,
-    tools=[
-        CompanyIncomeStatementTool(),
-        CompanyStockPerformanceTool(),
-        StockMarketSymbolSearchTool(),
-        CompanyOverviewTool(),
-    ],
-    agent_kwargs={
-        "system_message": SystemMessage(
-            content="""
+        from utils.market_data import compact, market_data, price_summary, price_table
+
+        prices = market_data().weekly_prices(symbol)
+        return compact(price_summary(prices), [price_table(prices)])
+
+
+@st.cache_resource
+def get_agent():
+    from langchain.agents import initialize_agent, AgentType
+    from langchain.chat_models import ChatOpenAI
+    from langchain.schema import SystemMessage
+    from utils.llm_cache import llm_cache
+
+    llm = ChatOpenAI(
+        temperature=0.1, model_name="gpt-3.5-turbo-1106", cache=llm_cache()
+    )
+    return initialize_agent(
+        llm=llm,
+        verbose=True,
+        agent=AgentType.OPENAI_FUNCTIONS,
+        handle_parsing_errors=True,
+        tools=[
+            CompanyIncomeStatementTool(),
+            CompanyStockPerformanceTool(),
+            StockMarketSymbolSearchTool(),
+            CompanyOverviewTool(),
+        ],
+        agent_kwargs={
+            "system_message": SystemMessage(
+                content="""
             You are a hedge fund manager.
             
             You evaluate a company and provide your opinion and reasons why the stock is a buy or not.
@@ -110,9 +128,9 @@ agent = initialize_agent(
             
             Be assertive in your judgement and recommend the stock or advise the user against it.
         """
-        )
-    },
-)
+            )
+        },
+    )
 
 st.set_page_config(
     page_title="InvestorGPT",
@@ -132,5 +150,5 @@ st.markdown(
 company = st.text_input("Write the name of the company you are interested on.")
 
 if company:
-    result = agent.invoke(company)
+    result = get_agent().invoke(company)
     st.write(result["output"].replace("$", "\$"))
\ No newline at end of file
@@ -1,12 +1,15 @@
 import json
 import time
 import os
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 import streamlit as st
-from openai import OpenAI, AssistantEventHandler
-from langchain_community.utilities import DuckDuckGoSearchAPIWrapper
-from bs4 import BeautifulSoup
-import requests
+from openai import AssistantEventHandler
 from typing_extensions import override
+from utils.html_text import extract_paragraphs
+from utils.http import fetch
+from utils.registry import openai_client, shared
+from utils.render import StreamRenderer
+from utils.tool_cache import cached_tool
 
 ASSISTANT_NAME = "Research Assistant"
 
@@ -17,10 +20,10 @@ st.sidebar.title("Settings")
 api_key = st.sidebar.text_input("Enter your OpenAI API Key", type="password")
 if api_key:
     # client.beta.api_key = api_key
-    client = OpenAI(
+    client = openai_client(
+        api_key,
         organization="org-l3stFe2ffnZM5sk17fbK0qKC",
         project="proj_X6ZoFeBCA6Dd4LssFgCguz8x",
-        api_key=api_key,
     )
 else:
     st.warning("Please enter your OpenAI API key to use the assistant.")
@@ -34,15 +37,17 @@ st.title("🕵️ Research Assistant using OpenAI Assistant API")
 
 class EventHandler(AssistantEventHandler):
 
-    message = ""
-
     @override
     def on_text_created(self, text) -> None:
-        self.message_box = st.empty()
+        self.renderer = StreamRenderer(
+            st.container(), transform=lambda message: message.replace("$", "\$")
+        )
 
     def on_text_delta(self, delta, snapshot):
-        self.message += delta.value
-        self.message_box.markdown(self.message.replace("$", "\$"))
+        self.renderer.append(delta.value)
+
+    def on_text_done(self, text):
+        self.renderer.close()
 
     def on_event(self, event):
 
@@ -51,19 +56,33 @@ class EventHandler(AssistantEventHandler):
 
 
 # 도구 정의
+HOUR = 60 * 60
+
+
+def is_result(output):
+    # Failures come back as messages for the assistant, don't keep them around
+    return not output.startswith(
+        ("Error", "Failed", "No Wikipedia page", "No results")
+    )
+
+
+@cached_tool("search_wikipedia", ttl=24 * HOUR, cacheable=is_result)
 def search_wikipedia(inputs):
     query = inputs["query"]
     url = f"https://en.wikipedia.org/wiki/{query.replace(' ', '_')}"
-    response = requests.get(url)
+    response = fetch(url)
     if response.status_code == 200:
-        soup = BeautifulSoup(response.text, "html.parser")
-        paragraphs = soup.find_all("p")
-        return " ".join(p.get_text() for p in paragraphs[:3])
+        return " ".join(extract_paragraphs(response.text)[:3])
     return "No Wikipedia page found."
 
 
+@cached_tool(
+    "search_duckduckgo", ttl=6 * HOUR, cacheable=is_result, ignore_case=True
+)
 def search_duckduckgo(inputs):
     try:
+        from langchain_community.utilities import DuckDuckGoSearchAPIWrapper
+
         ddg = DuckDuckGoSearchAPIWrapper()
         results = ddg.run(inputs["query"])
         return results if results else "No results found."
@@ -71,12 +90,12 @@ def search_duckduckgo(inputs):
         return f"Error fetching search results: {str(e)}"
 
 
+@cached_tool("scrape_website", ttl=HOUR, cacheable=is_result)
 def scrape_website(inputs):
     url = inputs["url"]
-    response = requests.get(url, headers={"User-Agent": "Mozilla/5.0"})
+    response = fetch(url, headers={"User-Agent": "Mozilla/5.0"})
     if response.status_code == 200:
-        soup = BeautifulSoup(response.text, "html.parser")
-        return " ".join(p.get_text() for p in soup.find_all("p"))[:2000]
+        return " ".join(extract_paragraphs(response.text))[:2000]
     return "Failed to scrape website."
 
 
@@ -170,7 +189,19 @@ def get_run(run_id, thread_id):
     )
 
 
+# Only the most recent messages are kept and painted
+MAX_MESSAGES = 50
+
+
+def thread_history(thread_id):
+    key = f"history-{thread_id}"
+    if key not in st.session_state:
+        st.session_state[key] = {"after": None, "messages": [], "stale": True}
+    return st.session_state[key]
+
+
 def send_message(thread_id, content):
+    thread_history(thread_id)["stale"] = True
     return client.beta.threads.messages.create(
         thread_id=thread_id,
         role="user",
@@ -179,10 +210,21 @@ def send_message(thread_id, content):
 
 
 def get_messages(thread_id):
-    messages = client.beta.threads.messages.list(thread_id=thread_id)
-    messages = list(messages)
-    messages.reverse()
-    return messages
+    # Only this session writes to its thread, so the cached history is
+    # current until it sends a message; then only newer ones are fetched.
+    history = thread_history(thread_id)
+    if history["stale"]:
+        kwargs = {"after": history["after"]} if history["after"] else {}
+        for message in client.beta.threads.messages.list(
+            thread_id=thread_id, order="asc", **kwargs
+        ):
+            history["messages"].append(
+                {"message": message.content[0].text.value, "role": message.role}
+            )
+            history["after"] = message.id
+        del history["messages"][:-MAX_MESSAGES]
+        history["stale"] = False
+    return history["messages"]
 
 
 def insert_message(message, role):
@@ -191,27 +233,41 @@ def insert_message(message, role):
 
 
 def paint_history(thread_id):
-    messages = get_messages(thread_id)
-    for message in messages:
-        insert_message(
-            message.content[0].text.value,
-            message.role,
-        )
+    for message in get_messages(thread_id):
+        insert_message(message["message"], message["role"])
+
+
+TOOL_TIMEOUT = 20
+
+
+def run_tool(function):
+    print(f"Calling function: {function.name} with arg {function.arguments}")
+    try:
+        return functions_map[function.name](json.loads(function.arguments))
+    except Exception as e:
+        return f"Error running {function.name}: {str(e)}"
 
 
 def get_tool_outputs(run_id, thread_id):
     run = get_run(run_id, thread_id)
+    actions = run.required_action.submit_tool_outputs.tool_calls
+    # Tool calls of one step are independent, so they run side by side
+    executor = ThreadPoolExecutor(max_workers=len(actions))
+    futures = [executor.submit(run_tool, action.function) for action in actions]
+    deadline = time.monotonic() + TOOL_TIMEOUT
     outputs = []
-    for action in run.required_action.submit_tool_outputs.tool_calls:
-        action_id = action.id
-        function = action.function
-        print(f"Calling function: {function.name} with arg {function.arguments}")
+    for action, future in zip(actions, futures):
+        try:
+            output = future.result(timeout=max(deadline - time.monotonic(), 0))
+        except TimeoutError:
+            output = f"{action.function.name} timed out."
         outputs.append(
             {
-                "output": functions_map[function.name](json.loads(function.arguments)),
-                "tool_call_id": action_id,
+                "output": output,
+                "tool_call_id": action.id,
             }
         )
+    executor.shutdown(wait=False)
     return outputs
 
 
@@ -226,26 +282,29 @@ def submit_tool_outputs(run_id, thread_id):
         stream.until_done()
 
 
-if "assistant" not in st.session_state:
-    assistants = client.beta.assistants.list(limit=10)
-    for a in assistants:
+def find_or_create_assistant():
+    for a in client.beta.assistants.list(limit=10):
         if a.name == ASSISTANT_NAME:
-            assistant = client.beta.assistants.retrieve(a.id)
-            break
-    else:
-        assistant = client.beta.assistants.create(
-            name=ASSISTANT_NAME,
-            instructions="You help users do research on the given query using search engines. You give users the summarization of the information you got.",
-            model="gpt-4o",
-            tools=functions,
-        )
+            return a.id
+    return client.beta.assistants.create(
+        name=ASSISTANT_NAME,
+        instructions="You help users do research on the given query using search engines. You give users the summarization of the information you got.",
+        model="gpt-4o",
+        tools=functions,
+    ).id
+
+
+# Looked up once per API key for the whole process, not once per session
+assistant_id = shared(
+    "assistant",
+    {"name": ASSISTANT_NAME, "tools": functions},
+    find_or_create_assistant,
+    api_key=api_key,
+)
 
-    thread = client.beta.threads.create()
-    st.session_state["assistant"] = assistant
-    st.session_state["thread"] = thread
-else:
-    assistant = st.session_state["assistant"]
-    thread = st.session_state["thread"]
+if "thread" not in st.session_state:
+    st.session_state["thread"] = client.beta.threads.create()
+thread = st.session_state["thread"]
 
 paint_history(thread.id)
 content = st.chat_input("What do you want to search?")
@@ -256,7 +315,7 @@ if content:
     with st.chat_message("assistant"):
         with client.beta.threads.runs.stream(
             thread_id=thread.id,
-            assistant_id=assistant.id,
+            assistant_id=assistant_id,
             event_handler=EventHandler(),
         ) as stream:
             stream.until_done()
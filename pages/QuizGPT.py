@@ -1,14 +1,22 @@
+import logging
 from pathlib import Path
 import streamlit as st
-from langchain.retrievers import WikipediaRetriever
 
-from langchain.document_loaders import UnstructuredFileLoader
-from langchain.chat_models import ChatOpenAI
 from langchain.prompts import PromptTemplate
 from langchain.callbacks import StreamingStdOutCallbackHandler
-from langchain.text_splitter import CharacterTextSplitter
-from pathlib import Path
 import json
+from utils.context import usage_log
+from utils.index_store import content_key
+from utils.loaders import load_chunks
+from utils.quiz_bank import (
+    add_questions,
+    context_windows,
+    load_bank,
+    sample_quiz,
+    save_bank,
+)
+from utils.registry import chat_model
+from utils.tokens import count_tokens, prewarm
 
 
 function = {
@@ -54,6 +62,8 @@ st.set_page_config(
     page_title="QuizGPT",
     page_icon="🧐",
 )
+prewarm()
+logger = logging.getLogger(__name__)
 
 st.title("Quiz GPT")
 
@@ -84,24 +94,85 @@ def split_file(file):
     Path("./.cache/quiz_files").mkdir(parents=True, exist_ok=True)
     with open(file_path, "wb+") as f:
         f.write(file_content)
-    splitter = CharacterTextSplitter.from_tiktoken_encoder(
-        separator="\n",
-        chunk_size=600,
-        chunk_overlap=100,
+    return load_chunks(
+        file_path,
+        {
+            "separators": ["\n"],
+            "chunk_size": 600,
+            "chunk_overlap": 100,
+        },
+    )
+
+
+LEVELS = ("EASY", "HARD")
+QUIZ_WINDOW_TOKENS = 3000
+QUIZ_MAX_WINDOWS = 8
+QUIZ_MAX_CONCURRENCY = 8
+
+
+def docs_key(docs):
+    return content_key(
+        "\n\n".join(doc.page_content for doc in docs).encode(),
+        {"window_tokens": QUIZ_WINDOW_TOKENS, "max_windows": QUIZ_MAX_WINDOWS},
     )
-    loader = UnstructuredFileLoader(f"{file_path}")
-    docs = loader.load_and_split(text_splitter=splitter)
-    return docs
 
 
-@st.cache_data(show_spinner="Making quiz...")
-def run_quiz_chain(_docs, topic, level):
+def build_question_bank(docs, key):
+    bank = load_bank(key)
+    if bank:
+        return bank
+    with st.spinner("Making quiz..."):
+        return generate_question_bank(docs, key)
+
+
+def generate_question_bank(docs, key):
     chain = prompt | llm
-    return chain.invoke({"context": _docs, "level": level})
+    windows = context_windows(docs, QUIZ_WINDOW_TOKENS, QUIZ_MAX_WINDOWS)
+    inputs = [
+        {"context": window, "level": level} for level in LEVELS for window in windows
+    ]
+    responses = chain.batch(
+        inputs,
+        config={
+            "max_concurrency": QUIZ_MAX_CONCURRENCY,
+            "callbacks": [StreamingStdOutCallbackHandler()],
+        },
+        return_exceptions=True,
+    )
+    bank = {level: [] for level in LEVELS}
+    errors = []
+    for i, (request, response) in enumerate(zip(inputs, responses), 1):
+        usage_log.info(
+            "QuizGPT %s request %d/%d: %d context tokens%s",
+            request["level"],
+            i,
+            len(inputs),
+            count_tokens(request["context"]),
+            " (failed)" if isinstance(response, Exception) else "",
+        )
+        if isinstance(response, Exception):
+            errors.append(response)
+            continue
+        try:
+            arguments = response.additional_kwargs["function_call"]["arguments"]
+            add_questions(bank[request["level"]], json.loads(arguments)["questions"])
+        except (KeyError, TypeError, ValueError) as e:
+            errors.append(e)
+    if not any(bank.values()):
+        raise errors[0] if errors else ValueError("No questions were generated")
+    if errors or not all(bank.values()):
+        # Only a complete bank is persisted, so the next session retries the
+        # windows that failed instead of living without them for good.
+        logger.warning("%d of %d quiz requests failed", len(errors), len(inputs))
+    else:
+        save_bank(key, bank)
+    return bank
 
 
 @st.cache_data(show_spinner="Making Wikipedia...")
 def wiki_search(term):
+    from langchain.retrievers import WikipediaRetriever
+
     retriever = WikipediaRetriever(top_k_results=2)
     docs = retriever.get_relevant_documents(term)
     return docs
@@ -132,7 +203,8 @@ with st.sidebar:
         if topic:
             docs = wiki_search(topic)
     st.markdown("---")
-    level = st.selectbox("Quiz Level", ("EASY", "HRAD"))
+    level = st.selectbox("Quiz Level", LEVELS)
+    new_quiz = st.button("New quiz")
     st.markdown("---")
     st.write("Github: https://github.com/haneulee/GPT-app/blob/main/pages/QuizGPT.py")
 
@@ -150,14 +222,7 @@ else:
     if not openai_api_key:
         st.error("Please input your OpenAI API Key on the sidebar")
     else:
-        llm = ChatOpenAI(
-            temperature=0.1,
-            streaming=True,
-            callbacks=[
-                StreamingStdOutCallbackHandler(),
-            ],
-            openai_api_key=openai_api_key,
-        ).bind(
+        llm = chat_model(openai_api_key, temperature=0.1, streaming=True).bind(
             function_call={
                 "name": "create_quiz",
             },
@@ -166,11 +231,23 @@ else:
             ],
         )
 
-        response = run_quiz_chain(docs, topic if topic else file.name, level)
-        response = response.additional_kwargs["function_call"]["arguments"]
+        key = docs_key(docs)
+        # A partial bank is kept for this session only
+        bank_key = f"bank-{key}"
+        if bank_key not in st.session_state:
+            st.session_state[bank_key] = build_question_bank(docs, key)
+        bank = st.session_state[bank_key]
+        # Keep the same sample across reruns until a new quiz is asked for
+        quiz_key = f"quiz-{key}-{level}"
+        if new_quiz or quiz_key not in st.session_state:
+            st.session_state[quiz_key] = sample_quiz(bank, level)
+
+        questions = st.session_state[quiz_key]
+        if not questions:
+            st.warning(f"There are no {level} questions for this document yet.")
+            st.stop()
 
         with st.form("questions_form"):
-            questions = json.loads(response)["questions"]
             question_count = len(questions)
             success_count = 0
             for idx, question in enumerate(questions):
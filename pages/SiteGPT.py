@@ -1,15 +1,23 @@
+import re
+import uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed
 import streamlit as st
-from langchain.document_loaders import SitemapLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.vectorstores.faiss import FAISS
-from langchain.embeddings import OpenAIEmbeddings, CacheBackedEmbeddings
-from langchain.storage import LocalFileStore
-from fake_useragent import UserAgent
-from bs4 import BeautifulSoup
 from langchain.schema.runnable import RunnablePassthrough, RunnableLambda
 from langchain.prompts import ChatPromptTemplate
-from langchain.chat_models import ChatOpenAI
 from langchain.callbacks.base import BaseCallbackHandler
+from langchain.schema import Document
+from utils.html_text import extract_text
+from utils.index_store import (
+    content_key,
+    has_index,
+    load_index,
+    load_lexical,
+    load_snapshot,
+    save_index,
+)
+from utils.registry import chat_model, shared
+from utils.render import StreamRenderer
+from utils.tokens import prewarm
 
 
 answers_prompt = ChatPromptTemplate.from_template(
@@ -41,29 +49,97 @@ answers_prompt = ChatPromptTemplate.from_template(
 )
 
 
+# Per-doc answers are independent, so they are requested in parallel.
+ANSWERS_MAX_CONCURRENCY = 8
+ANSWER_TIMEOUT = 30
+
+
 def get_answers(inputs):
     docs = inputs["docs"]
     question = inputs["question"]
 
     answers_chain = answers_prompt | llm_for_get_answer
+    results = answers_chain.batch(
+        [{"question": question, "context": doc.page_content} for doc in docs],
+        config={"max_concurrency": ANSWERS_MAX_CONCURRENCY},
+        return_exceptions=True,
+    )
     return {
         "answers": [
             {
-                "answer": answers_chain.invoke(
-                    {
-                        "question": question,
-                        "context": doc.page_content,
-                    }
-                ).content,
+                "answer": result.content,
                 "source": doc.metadata["source"],
                 "date": doc.metadata["lastmod"],
             }
-            for doc in docs
+            for doc, result in zip(docs, results)
+            # A failed or timed out doc is skipped instead of failing the question
+            if not isinstance(result, Exception)
         ],
         "question": question,
     }
 
 
+# Early-exit mode: synthesis starts once enough good answers are in or the
+# deadline passes, instead of waiting for the slowest doc.
+EARLY_EXIT_MIN_SCORE = 4
+EARLY_EXIT_ANSWERS = 2
+EARLY_EXIT_DEADLINE = 10
+
+
+def parse_score(answer):
+    match = re.search(r"Score:\s*(\d+)", answer)
+    return int(match.group(1)) if match else None
+
+
+def stream_answers(docs, question, deadline):
+    answers_chain = answers_prompt | llm_for_get_answer
+    executor = ThreadPoolExecutor(max_workers=ANSWERS_MAX_CONCURRENCY)
+    futures = {
+        executor.submit(
+            answers_chain.invoke,
+            {"question": question, "context": doc.page_content},
+        ): doc
+        for doc in docs
+    }
+    try:
+        for future in as_completed(futures, timeout=deadline):
+            if future.exception():
+                continue
+            doc = futures[future]
+            yield {
+                "answer": future.result().content,
+                "source": doc.metadata["source"],
+                "date": doc.metadata["lastmod"],
+            }
+    except TimeoutError:
+        pass
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def get_answers_early(inputs):
+    docs = inputs["docs"]
+    question = inputs["question"]
+
+    answers = []
+    good_answers = 0
+    with st.status("Reading pages...") as status:
+        for answer in stream_answers(docs, question, EARLY_EXIT_DEADLINE):
+            score = parse_score(answer["answer"])
+            if score == 0:
+                continue
+            # Answers the model forgot to score are kept, ranked after scored ones
+            answers.append((-1 if score is None else score, answer))
+            st.markdown(f"{answer['answer']}  \n{answer['source']}")
+            if score is not None and score >= EARLY_EXIT_MIN_SCORE:
+                good_answers += 1
+                if good_answers >= EARLY_EXIT_ANSWERS:
+                    break
+        status.update(label=f"Read {len(answers)} useful pages", state="complete")
+    answers.sort(key=lambda item: item[0], reverse=True)
+    return {"answers": [answer for _, answer in answers], "question": question}
+
+
 choose_prompt = ChatPromptTemplate.from_messages(
     [
         (
@@ -102,77 +178,183 @@ def choose_answer(inputs):
         for answer in answers
     )
 
-    return choose_chain.invoke({"answers": condensed, "question": question})
+    return choose_chain.invoke(
+        {"answers": condensed, "question": question},
+        config={"callbacks": [ChatCallbackHandler()]},
+    )
+
 
+def parse_page(html):
+    return extract_text(html, strip_tags=("header", "footer")).replace("\n", "")
 
-def parse_page(soup: BeautifulSoup):
-    header = soup.find("header")
-    footer = soup.find("footer")
-    if header:
-        header.decompose()
-    if footer:
-        footer.decompose()
-    return str(soup.get_text()).replace("\n", "")
 
+SPLITTER_SETTINGS = {
+    "chunk_size": 1000,
+    "chunk_overlap": 200,
+}
 
-@st.cache_resource(show_spinner="Loading Website...")
-def load_website(url):
-    splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-        chunk_size=1000, chunk_overlap=200
+FILTER_URLS = [
+    r"https:\/\/developers.cloudflare.com/ai-gateway.*",
+    r"https:\/\/developers.cloudflare.com/vectorize.*",
+    r"https:\/\/developers.cloudflare.com/workers-ai.*",
+]
+
+
+def page_document(store, entry):
+    html = store.html(entry["loc"])
+    if html is None:
+        return None
+    return Document(
+        page_content=parse_page(html),
+        metadata={
+            "source": entry["loc"],
+            "loc": entry["loc"],
+            "lastmod": entry["lastmod"],
+        },
+    )
+
+
+# Refreshed daily; each refresh only re-embeds pages the sitemap says changed.
+WEBSITE_MAX_AGE = 60 * 60 * 24
+
+
+def website_retriever(url):
+    from utils.embeddings import cached_embeddings
+
+    def build():
+        with st.spinner("Loading Website..."):
+            return load_website(url)
+
+    # One index per URL for every session; only query embeddings are per key.
+    # The site is part of the config so a refreshed index gets new views.
+    site = shared("website", {"url": url}, build, max_age=WEBSITE_MAX_AGE)
+    return shared(
+        "website_view",
+        {"url": url, "site": id(site)},
+        lambda: site.with_embeddings(cached_embeddings(openai_api_key)),
+        api_key=openai_api_key,
+        max_age=WEBSITE_MAX_AGE,
     )
 
-    loader = SitemapLoader(
+
+def load_website(url):
+    from fake_useragent import UserAgent
+    from utils import vector_index
+    from utils.crawler import PageStore, crawl_sitemap
+    from utils.embeddings import cached_embeddings
+    from utils.hybrid import BM25Index, HybridRetriever
+    from utils.splitter import TokenSplitter
+
+    splitter = TokenSplitter(**SPLITTER_SETTINGS)
+
+    store = PageStore("./.cache/pages.db")
+    ua = UserAgent()
+    progress = st.progress(0.0, text="Crawling pages...")
+    entries, statuses = crawl_sitemap(
         url,
-        # filter_urls=[],
-        filter_urls=(
-            [
-                r"https:\/\/developers.cloudflare.com/ai-gateway.*",
-                r"https:\/\/developers.cloudflare.com/vectorize.*",
-                r"https:\/\/developers.cloudflare.com/workers-ai.*",
-            ]
+        store,
+        filter_urls=FILTER_URLS,
+        headers={"User-Agent": ua.random},
+        on_progress=lambda done, total: progress.progress(
+            done / total, text=f"Crawling pages... ({done}/{total})"
         ),
-        parsing_function=parse_page,
     )
-    # loader.requests_per_second = 1
-    ua = UserAgent()
-    loader.headers = {"User-Agent": ua.random}
-    docs = loader.load_and_split(splitter)
-
-    embeddings = OpenAIEmbeddings(openai_api_key=openai_api_key)
-
-    url_copy = url[:]
-    cache_filename = url_copy.replace("/", "_")
-    cache_filename.strip()
-    cache_dir = LocalFileStore(f"./.cache/{cache_filename}/")
-    cached_embeddings = CacheBackedEmbeddings.from_bytes_store(
-        embeddings,
-        cache_dir,
+    progress.empty()
+
+    key = content_key(url.encode(), {**SPLITTER_SETTINGS, "filter_urls": FILTER_URLS})
+    snapshot = load_snapshot(key) if has_index(key) else {}
+    current = {entry["loc"]: entry for entry in entries}
+    removed = [loc for loc in snapshot if loc not in current]
+    # PageStore saves pages as they are crawled but the snapshot only when the
+    # index is saved, so a refresh that died in between shows up as a lastmod
+    # mismatch even though the page itself now reads as unchanged.
+    changed = [
+        loc
+        for loc in current
+        if loc not in snapshot
+        or statuses[loc] in ("new", "modified")
+        or snapshot[loc]["lastmod"] != current[loc]["lastmod"]
+    ]
+
+    progress = st.progress(0.0, text="Embedding pages...")
+    embeddings = cached_embeddings(
+        openai_api_key,
+        on_progress=lambda done, total: progress.progress(
+            done / total, text=f"Embedding pages... ({done}/{total})"
+        ),
     )
-    vector_store = FAISS.from_documents(docs, cached_embeddings)
-    return vector_store.as_retriever()
+    if snapshot and not removed and not changed:
+        progress.empty()
+        vector_store = load_index(key, embeddings)
+        return HybridRetriever(
+            vectorstore=vector_store, lexical=load_lexical(key, vector_store)
+        )
+
+    vector_store = load_index(key, embeddings, mmap=False) if snapshot else None
+    lexical = load_lexical(key, vector_store) if snapshot else BM25Index()
+    stale_ids = [
+        doc_id
+        for loc in removed + changed
+        for doc_id in snapshot.get(loc, {}).get("ids", [])
+    ]
+    if stale_ids:
+        vector_store = vector_index.remove(vector_store, stale_ids)
+        lexical.remove(stale_ids)
+    for loc in removed:
+        del snapshot[loc]
+
+    docs = []
+    for loc in changed:
+        doc = page_document(store, current[loc])
+        if doc is None:
+            # Never fetched successfully, try again on the next refresh
+            continue
+        chunks = splitter.split_documents([doc])
+        ids = [str(uuid.uuid4()) for _ in chunks]
+        snapshot[loc] = {"lastmod": current[loc]["lastmod"], "ids": ids}
+        docs.extend(zip(ids, chunks))
+
+    if docs:
+        ids, chunks = zip(*docs)
+        lexical.add(ids, [chunk.page_content for chunk in chunks])
+        if vector_store is None:
+            vector_store = vector_index.build(list(chunks), embeddings, ids)
+        else:
+            vector_store = vector_index.add(vector_store, list(chunks), list(ids))
+        vector_store = vector_index.fit(vector_store)
+    progress.empty()
+    if vector_store is None:
+        # Raising keeps the failed load out of the registry so it is retried
+        raise ValueError(f"No pages could be loaded from {url}")
+    save_index(key, vector_store, snapshot, lexical)
+    return HybridRetriever(vectorstore=vector_store, lexical=lexical)
 
 
 # Chat & Streaming
 class ChatCallbackHandler(BaseCallbackHandler):
-    message = ""
-
     def on_llm_start(self, *args, **kwargs):
-        self.message_box = st.empty()
+        self.renderer = StreamRenderer(st.container())
 
-    def on_llm_end(self, *args, **kwargs):
-        save_message(self.message, "ai")
+    def on_llm_end(self, response, *args, **kwargs):
+        message = self.renderer.close(response.generations[0][0].text)
+        save_message(message, "ai")
 
     def on_llm_new_token(self, token, *args, **kwargs):
-        self.message += token
-        self.message_box.markdown(self.message)
+        self.renderer.append(token)
 
 
 if "messages" not in st.session_state:
     st.session_state["messages"] = []
 
 
+# Only the most recent messages are kept, so long chats don't slow every rerun
+MAX_MESSAGES = 50
+
+
 def save_message(message, role):
-    st.session_state["messages"].append({"message": message, "role": role})
+    messages = st.session_state["messages"]
+    messages.append({"message": message, "role": role})
+    del messages[:-MAX_MESSAGES]
 
 
 def send_message(message, role, save=True):
@@ -191,6 +373,7 @@ st.set_page_config(
     page_title="SiteGPT",
     page_icon="🖥️",
 )
+prewarm()
 
 st.markdown(
     """
@@ -211,6 +394,7 @@ with st.sidebar:
         value="https://developers.cloudflare.com/sitemap.xml",
         disabled=True,
     )
+    early_exit = st.checkbox("Answer as soon as good sources are found", value=False)
     st.markdown("---")
     st.write("Github: https://github.com/haneulee/GPT-app/blob/main/pages/SiteGPT.py")
 
@@ -222,18 +406,17 @@ if url:
         st.error("Please input your OpenAI API Key on the sidebar")
     else:
         paint_history()
-        llm_for_get_answer = ChatOpenAI(
+        llm_for_get_answer = chat_model(
+            openai_api_key,
             temperature=0.1,
-            openai_api_key=openai_api_key,
+            request_timeout=ANSWER_TIMEOUT,
+            max_retries=1,
         )
-        llm_for_choose_answer = ChatOpenAI(
-            temperature=0.1,
-            openai_api_key=openai_api_key,
-            streaming=True,
-            callbacks=[ChatCallbackHandler()],
+        llm_for_choose_answer = chat_model(
+            openai_api_key, temperature=0.1, streaming=True
         )
 
-        retriever = load_website(url)
+        retriever = website_retriever(url)
         query = st.chat_input("Ask a question to the website.")
         if query:
             send_message(query, "human")
@@ -242,7 +425,7 @@ if url:
                     "docs": retriever,
                     "question": RunnablePassthrough(),
                 }
-                | RunnableLambda(get_answers)
+                | RunnableLambda(get_answers_early if early_exit else get_answers)
                 | RunnableLambda(choose_answer)
             )
 
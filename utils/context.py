@@ -0,0 +1,63 @@
+import logging
+from collections import namedtuple
+
+from utils.tokens import count_tokens
+
+PackedContext = namedtuple("PackedContext", ["text", "tokens", "docs"])
+
+# Prompt tokens per request, printed at INFO without any logging setup
+usage_log = logging.getLogger("token_usage")
+if not usage_log.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+    usage_log.addHandler(_handler)
+    usage_log.setLevel(logging.INFO)
+    usage_log.propagate = False
+
+# Shorter matches are too likely to be coincidence rather than chunk_overlap.
+MIN_OVERLAP_CHARS = 20
+
+
+def _overlap(head, tail):
+    """Length of the longest suffix of ``head`` that is also a prefix of ``tail``."""
+    probe = tail[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return 0
+    start = head.find(probe, max(len(head) - len(tail), 0))
+    while start != -1:
+        if tail.startswith(head[start:]):
+            return len(head) - start
+        start = head.find(probe, start + 1)
+    return 0
+
+
+def remove_overlap(text, pieces):
+    """Strips the parts of ``text`` that repeat the edges of ``pieces``,
+    or returns "" when ``text`` is already contained in one of them."""
+    text = text.strip()
+    for piece in pieces:
+        if text in piece:
+            return ""
+        text = text[_overlap(piece, text) :]
+        cut = _overlap(text, piece)
+        if cut:
+            text = text[:-cut]
+    return text.strip()
+
+
+def pack_context(docs, budget, separator="\n\n"):
+    """Fills ``budget`` tokens with ``docs`` in the order given (most
+    relevant first), skipping any that no longer fit."""
+    pieces, kept, used = [], [], 0
+    separator_tokens = count_tokens(separator)
+    for doc in docs:
+        text = remove_overlap(doc.page_content, pieces)
+        if not text:
+            continue
+        tokens = count_tokens(text) + (separator_tokens if pieces else 0)
+        if used + tokens > budget:
+            continue
+        pieces.append(text)
+        kept.append(doc)
+        used += tokens
+    return PackedContext(separator.join(pieces), used, kept)
@@ -0,0 +1,205 @@
+import asyncio
+import re
+import threading
+import time
+import zlib
+from collections import defaultdict
+from urllib.parse import urlparse
+from xml.etree import ElementTree
+
+import httpx
+
+from utils.db import connect
+
+SITEMAP_NS = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+
+
+class PageStore:
+    """Downloaded pages and their validators, committed one page at a time
+    so an interrupted crawl picks up where it stopped."""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        with self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS pages (
+                    url TEXT PRIMARY KEY,
+                    lastmod TEXT,
+                    etag TEXT,
+                    last_modified TEXT,
+                    html BLOB NOT NULL,
+                    fetched_at REAL NOT NULL
+                )
+                """
+            )
+
+    def get(self, url):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT lastmod, etag, last_modified, fetched_at FROM pages WHERE url = ?",
+                (url,),
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("lastmod", "etag", "last_modified", "fetched_at"), row))
+
+    def html(self, url):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT html FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+        return zlib.decompress(row[0]).decode() if row else None
+
+    def put(self, url, lastmod, etag, last_modified, html):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    url,
+                    lastmod,
+                    etag,
+                    last_modified,
+                    zlib.compress(html.encode()),
+                    time.time(),
+                ),
+            )
+
+    def touch(self, url, lastmod):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE pages SET lastmod = ?, fetched_at = ? WHERE url = ?",
+                (lastmod, time.time(), url),
+            )
+
+
+def parse_sitemap(xml):
+    root = ElementTree.fromstring(xml)
+    entries = []
+    for node in root:
+        loc = node.findtext(f"{SITEMAP_NS}loc")
+        if loc:
+            entries.append(
+                {
+                    "loc": loc.strip(),
+                    "lastmod": (node.findtext(f"{SITEMAP_NS}lastmod") or "").strip()
+                    or None,
+                }
+            )
+    return root.tag == f"{SITEMAP_NS}sitemapindex", entries
+
+
+class Crawler:
+    def __init__(
+        self,
+        store,
+        headers=None,
+        max_connections=20,
+        per_host_concurrency=4,
+        requests_per_second=5,
+        max_age=24 * 60 * 60,
+        timeout=20,
+    ):
+        self.store = store
+        self.headers = headers or {}
+        self.max_connections = max_connections
+        self.per_host_concurrency = per_host_concurrency
+        self.requests_per_second = requests_per_second
+        self.max_age = max_age
+        self.timeout = timeout
+
+    async def _wait_turn(self, host):
+        # Reserve the next free slot for this host, then sleep until it comes.
+        slot = max(time.monotonic(), self._next_slot[host])
+        self._next_slot[host] = slot + 1 / self.requests_per_second
+        await asyncio.sleep(slot - time.monotonic())
+
+    async def _get(self, url, headers=None):
+        host = urlparse(url).netloc
+        async with self._semaphores[host]:
+            await self._wait_turn(host)
+            return await self._client.get(url, headers=headers)
+
+    async def read_sitemap(self, url, filter_urls=None):
+        response = await self._get(url)
+        response.raise_for_status()
+        is_index, entries = parse_sitemap(response.content)
+        if is_index:
+            nested = await asyncio.gather(
+                *(self.read_sitemap(entry["loc"], filter_urls) for entry in entries)
+            )
+            return [entry for sitemap in nested for entry in sitemap]
+        if filter_urls:
+            entries = [
+                entry
+                for entry in entries
+                if any(re.match(pattern, entry["loc"]) for pattern in filter_urls)
+            ]
+        return entries
+
+    async def fetch(self, entry):
+        url, lastmod = entry["loc"], entry["lastmod"]
+        stored = self.store.get(url)
+        if stored:
+            if lastmod and stored["lastmod"] == lastmod:
+                return "unchanged"
+            if not lastmod and time.time() - stored["fetched_at"] < self.max_age:
+                return "unchanged"
+
+        headers = {}
+        if stored and stored["etag"]:
+            headers["If-None-Match"] = stored["etag"]
+        if stored and stored["last_modified"]:
+            headers["If-Modified-Since"] = stored["last_modified"]
+        try:
+            response = await self._get(url, headers=headers)
+        except httpx.HTTPError:
+            return "failed"
+
+        if response.status_code == 304:
+            self.store.touch(url, lastmod)
+            return "unchanged"
+        if response.status_code != 200:
+            return "failed"
+        self.store.put(
+            url,
+            lastmod,
+            response.headers.get("etag"),
+            response.headers.get("last-modified"),
+            response.text,
+        )
+        return "modified" if stored else "new"
+
+    async def crawl(self, url, filter_urls=None, on_progress=None):
+        self._semaphores = defaultdict(
+            lambda: asyncio.Semaphore(self.per_host_concurrency)
+        )
+        self._next_slot = defaultdict(float)
+        limits = httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_connections,
+        )
+        async with httpx.AsyncClient(
+            headers=self.headers,
+            limits=limits,
+            timeout=self.timeout,
+            follow_redirects=True,
+        ) as client:
+            self._client = client
+            entries = await self.read_sitemap(url, filter_urls)
+            entries = list({entry["loc"]: entry for entry in entries}.values())
+            tasks = [asyncio.ensure_future(self.fetch(entry)) for entry in entries]
+            for done, future in enumerate(asyncio.as_completed(tasks), start=1):
+                await future
+                if on_progress:
+                    on_progress(done, len(tasks))
+        statuses = {entry["loc"]: task.result() for entry, task in zip(entries, tasks)}
+        return entries, statuses
+
+
+def crawl_sitemap(url, store, filter_urls=None, on_progress=None, **kwargs):
+    """Returns the sitemap entries and a status per URL: "new", "modified",
+    "unchanged" or "failed"."""
+    crawler = Crawler(store, **kwargs)
+    return asyncio.run(crawler.crawl(url, filter_urls, on_progress))
@@ -0,0 +1,17 @@
+import sqlite3
+from pathlib import Path
+
+
+def connect(path):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def chunked(items, size=500):
+    # Keeps "IN (?, ?, ...)" queries under SQLite's bound-parameter limit.
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
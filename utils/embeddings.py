@@ -0,0 +1,252 @@
+import hashlib
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import EncoderBackedStore
+from langchain_community.embeddings import OpenAIEmbeddings
+from langchain_core.embeddings import Embeddings
+from langchain_core.stores import ByteStore
+
+from utils.registry import singleton
+from utils.sqlite_store import SQLiteStore
+from utils.tokens import count_tokens
+
+EMBEDDING_CACHE_PATH = "./.cache/embeddings.db"
+EMBEDDING_CACHE_MAX_BYTES = 4 * 1024**3
+QUERY_CACHE_SIZE = 2048
+
+
+def is_rate_limit(error):
+    return getattr(error, "status_code", None) == 429
+
+
+def retry_after(error):
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class BatchedEmbeddings(Embeddings):
+    """Embeds documents in token-budgeted batches on a bounded worker pool.
+
+    A 429 from any worker pauses every worker until the shared backoff has
+    elapsed; the backoff doubles on consecutive rate limits and decays again
+    on successful batches. Queries arriving within ``query_batch_window``
+    seconds of each other share one request.
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        max_tokens_per_batch=8000,
+        max_texts_per_batch=256,
+        max_workers=4,
+        max_retries=6,
+        on_progress=None,
+        query_batch_window=0.005,
+    ):
+        self.embeddings = embeddings
+        self.max_tokens_per_batch = max_tokens_per_batch
+        self.max_texts_per_batch = max_texts_per_batch
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.on_progress = on_progress
+        self.query_batch_window = query_batch_window
+        self._query_batch = None
+        self._lock = threading.Lock()
+        self._backoff = 0.0
+        self._resume_at = 0.0
+
+    def _batches(self, texts):
+        batch, tokens = [], 0
+        for i, text in enumerate(texts):
+            count = count_tokens(text)
+            if batch and (
+                tokens + count > self.max_tokens_per_batch
+                or len(batch) >= self.max_texts_per_batch
+            ):
+                yield batch
+                batch, tokens = [], 0
+            batch.append(i)
+            tokens += count
+        if batch:
+            yield batch
+
+    def _wait_for_cooldown(self):
+        while True:
+            with self._lock:
+                delay = self._resume_at - time.monotonic()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def _on_rate_limit(self, error):
+        with self._lock:
+            self._backoff = min(max(self._backoff * 2, 1.0), 60.0)
+            delay = max(retry_after(error) or 0.0, self._backoff)
+            delay *= random.uniform(1.0, 1.25)
+            self._resume_at = max(self._resume_at, time.monotonic() + delay)
+
+    def _on_success(self):
+        with self._lock:
+            self._backoff = self._backoff / 2 if self._backoff > 0.5 else 0.0
+
+    def _embed_batch(self, texts):
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_cooldown()
+            try:
+                vectors = self.embeddings.embed_documents(texts)
+            except Exception as e:
+                if not is_rate_limit(e) or attempt == self.max_retries:
+                    raise
+                self._on_rate_limit(e)
+            else:
+                self._on_success()
+                return vectors
+
+    def embed_documents(self, texts):
+        vectors = [None] * len(texts)
+        done = 0
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            futures = {
+                executor.submit(self._embed_batch, [texts[i] for i in batch]): batch
+                for batch in self._batches(texts)
+            }
+            for future in as_completed(futures):
+                batch = futures[future]
+                for i, vector in zip(batch, future.result()):
+                    vectors[i] = vector
+                done += len(batch)
+                if self.on_progress:
+                    self.on_progress(done, len(texts))
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        return vectors
+
+    def embed_query(self, text):
+        with self._lock:
+            batch = self._query_batch
+            leader = batch is None
+            if leader:
+                batch = self._query_batch = {"texts": {}, "done": threading.Event()}
+            index = batch["texts"].setdefault(text, len(batch["texts"]))
+
+        if leader:
+            # Gather the queries of concurrent sessions into one request
+            time.sleep(self.query_batch_window)
+            with self._lock:
+                self._query_batch = None
+            try:
+                batch["vectors"] = self._embed_batch(list(batch["texts"]))
+            except Exception as e:
+                batch["error"] = e
+            finally:
+                batch["done"].set()
+        else:
+            batch["done"].wait()
+
+        if "error" in batch:
+            raise batch["error"]
+        return batch["vectors"][index]
+
+
+class LRUStore(ByteStore):
+    """Keeps the most recently used values of ``store`` in memory."""
+
+    def __init__(self, store, maxsize=QUERY_CACHE_SIZE):
+        self.store = store
+        self.maxsize = maxsize
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, pairs):
+        with self._lock:
+            for key, value in pairs:
+                self._values[key] = value
+                self._values.move_to_end(key)
+            while len(self._values) > self.maxsize:
+                self._values.popitem(last=False)
+
+    def mget(self, keys):
+        with self._lock:
+            values = [self._values.get(key) for key in keys]
+            for key, value in zip(keys, values):
+                if value is not None:
+                    self._values.move_to_end(key)
+        missing = [key for key, value in zip(keys, values) if value is None]
+        if not missing:
+            return values
+        fetched = dict(zip(missing, self.store.mget(missing)))
+        self._remember(
+            (key, value) for key, value in fetched.items() if value is not None
+        )
+        return [
+            fetched.get(key) if value is None else value
+            for key, value in zip(keys, values)
+        ]
+
+    def mset(self, key_value_pairs):
+        key_value_pairs = list(key_value_pairs)
+        self.store.mset(key_value_pairs)
+        self._remember(key_value_pairs)
+
+    def mdelete(self, keys):
+        self.store.mdelete(keys)
+        with self._lock:
+            for key in keys:
+                self._values.pop(key, None)
+
+    def yield_keys(self, prefix=None):
+        yield from self.store.yield_keys(prefix=prefix)
+
+
+@singleton
+def shared_store():
+    return SQLiteStore(EMBEDDING_CACHE_PATH, max_bytes=EMBEDDING_CACHE_MAX_BYTES)
+
+
+def sha1(text):
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+@singleton
+def shared_query_store():
+    return LRUStore(shared_store())
+
+
+def normalize_query(text):
+    return " ".join(text.split()).lower()
+
+
+def embedding_store(store, namespace, normalize=None):
+    # Vectors are kept as raw float32 blobs keyed by a hash of the chunk text,
+    # so the same text is embedded once no matter which file or site it is from.
+    normalize = normalize or (lambda text: text)
+    return EncoderBackedStore(
+        store,
+        lambda text: f"{namespace}:{sha1(normalize(text))}",
+        lambda vector: np.asarray(vector, dtype=np.float32).tobytes(),
+        lambda blob: np.frombuffer(blob, dtype=np.float32).tolist(),
+    )
+
+
+def cached_embeddings(openai_api_key, store=None, on_progress=None, **kwargs):
+    # OPENAI_API_BASE can point this at a local fake embedding server.
+    embeddings = OpenAIEmbeddings(openai_api_key=openai_api_key, max_retries=0)
+    query_store = LRUStore(store) if store else shared_query_store()
+    return CacheBackedEmbeddings(
+        BatchedEmbeddings(embeddings, on_progress=on_progress, **kwargs),
+        embedding_store(store or shared_store(), embeddings.model),
+        # Questions are cached too, with the in-process LRU in front
+        query_embedding_store=embedding_store(
+            query_store, f"query:{embeddings.model}", normalize_query
+        ),
+    )
@@ -0,0 +1,59 @@
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+
+CODE_TAGS = ["script", "style", "template"]
+
+
+class SelectolaxExtractor:
+    # C-backed lexbor parser, several times faster than BeautifulSoup.
+
+    def text(self, html, strip_tags=()):
+        tree = LexborHTMLParser(html)
+        tree.strip_tags(CODE_TAGS)
+        for tag in strip_tags:
+            node = tree.css_first(tag)
+            if node:
+                node.decompose()
+        return tree.root.text() if tree.root else ""
+
+    def paragraphs(self, html):
+        tree = LexborHTMLParser(html)
+        tree.strip_tags(CODE_TAGS)
+        return [node.text() for node in tree.css("p")]
+
+
+class SoupExtractor:
+    def text(self, html, strip_tags=()):
+        from bs4 import BeautifulSoup
+
+        soup = BeautifulSoup(html, "html.parser")
+        for tag in strip_tags:
+            node = soup.find(tag)
+            if node:
+                node.decompose()
+        return soup.get_text()
+
+    def paragraphs(self, html):
+        from bs4 import BeautifulSoup
+
+        soup = BeautifulSoup(html, "html.parser")
+        for node in soup.find_all(CODE_TAGS):
+            node.decompose()
+        return [p.get_text() for p in soup.find_all("p")]
+
+
+default_extractor = (
+    SelectolaxExtractor() if LexborHTMLParser is not None else SoupExtractor()
+)
+
+
+def extract_text(html, strip_tags=()):
+    """Text of the page with the first of each ``strip_tags`` element removed."""
+    return default_extractor.text(html, strip_tags)
+
+
+def extract_paragraphs(html):
+    return default_extractor.paragraphs(html)
@@ -0,0 +1,97 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_TIMEOUT = 10
+MAX_RESPONSE_BYTES = 2 * 1024 * 1024
+POOL_SIZE = 20
+PER_HOST_CONCURRENCY = 8
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float("inf"))
+
+_lock = threading.Lock()
+_session = None
+_host_slots = defaultdict(lambda: threading.BoundedSemaphore(PER_HOST_CONCURRENCY))
+_latencies = defaultdict(lambda: [0] * len(LATENCY_BUCKETS))
+
+
+def get_session():
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                retry = Retry(
+                    total=3,
+                    backoff_factor=0.5,
+                    status_forcelist=(429, 500, 502, 503, 504),
+                    allowed_methods=("GET", "HEAD"),
+                    respect_retry_after_header=True,
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(
+                    pool_connections=POOL_SIZE,
+                    pool_maxsize=POOL_SIZE,
+                    max_retries=retry,
+                )
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+def _record_latency(host, seconds):
+    with _lock:
+        _latencies[host][bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+
+def latency_histogram():
+    """Request counts per host, bucketed by the upper bound in seconds."""
+    with _lock:
+        return {
+            host: dict(zip(LATENCY_BUCKETS, counts))
+            for host, counts in _latencies.items()
+        }
+
+
+def fetch(
+    url,
+    params=None,
+    headers=None,
+    timeout=DEFAULT_TIMEOUT,
+    max_bytes=MAX_RESPONSE_BYTES,
+):
+    """GETs ``url`` on the shared keep-alive session.
+
+    At most ``PER_HOST_CONCURRENCY`` requests per host are in flight at
+    once. The body is read at most ``max_bytes`` far; anything past that is
+    dropped so one huge page can't stall a tool call.
+    """
+    host = urlparse(url).netloc
+    with _lock:
+        slots = _host_slots[host]
+    with slots:
+        started = time.monotonic()
+        try:
+            with get_session().get(
+                url, params=params, headers=headers, timeout=timeout, stream=True
+            ) as response:
+                body = bytearray()
+                for chunk in response.iter_content(64 * 1024):
+                    body.extend(chunk)
+                    if len(body) >= max_bytes:
+                        del body[max_bytes:]
+                        break
+                response._content = bytes(body)
+        finally:
+            _record_latency(host, time.monotonic() - started)
+    return response
+
+
+def get_json(url, params=None, **kwargs):
+    return fetch(url, params=params, **kwargs).json()
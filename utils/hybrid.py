@@ -0,0 +1,205 @@
+import math
+import pickle
+import re
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+from pydantic import PrivateAttr
+
+from utils.registry import singleton
+
+# Keeps identifiers such as workers-ai, env.AI or 1020 whole, and also
+# indexes their parts.
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[._\-/][a-z0-9]+)*")
+PART_RE = re.compile(r"[._\-/]")
+
+
+def tokenize(text):
+    tokens = []
+    for token in TOKEN_RE.findall(text.lower()):
+        tokens.append(token)
+        parts = PART_RE.split(token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+class BM25Index:
+    """In-memory BM25 inverted index over document ids, saved with pickle.
+
+    Searches score with numpy over per-term posting arrays, built the first
+    time a term is queried and dropped whenever the index changes, so common
+    terms with long posting lists don't cost a Python loop per document.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.docs = {}
+        self.postings = defaultdict(dict)
+        self.total_length = 0
+        self._arrays = None
+
+    def __len__(self):
+        return len(self.docs)
+
+    def add(self, ids, texts):
+        self._arrays = None
+        for doc_id, text in zip(ids, texts):
+            if doc_id in self.docs:
+                self.remove([doc_id])
+            counts = Counter(tokenize(text))
+            self.docs[doc_id] = (counts, sum(counts.values()))
+            self.total_length += self.docs[doc_id][1]
+            for term, count in counts.items():
+                self.postings[term][doc_id] = count
+
+    def remove(self, ids):
+        self._arrays = None
+        for doc_id in ids:
+            entry = self.docs.pop(doc_id, None)
+            if entry is None:
+                continue
+            counts, length = entry
+            self.total_length -= length
+            for term in counts:
+                postings = self.postings[term]
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self.postings[term]
+
+    def _prepare(self):
+        arrays = self._arrays
+        if arrays is None:
+            ids = list(self.docs)
+            lengths = np.fromiter(
+                (self.docs[doc_id][1] for doc_id in ids), np.float32, len(ids)
+            )
+            average_length = self.total_length / len(ids)
+            norms = self.k1 * (1 - self.b + self.b * lengths / average_length)
+            slots = {doc_id: slot for slot, doc_id in enumerate(ids)}
+            arrays = self._arrays = (ids, slots, norms, {})
+        return arrays
+
+    def _term_arrays(self, term, slots, terms):
+        arrays = terms.get(term)
+        if arrays is None:
+            postings = self.postings.get(term, {})
+            arrays = terms[term] = (
+                np.fromiter(
+                    (slots[doc_id] for doc_id in postings), np.int64, len(postings)
+                ),
+                np.fromiter(postings.values(), np.float32, len(postings)),
+            )
+        return arrays
+
+    def search(self, query, k=4):
+        if not self.docs:
+            return []
+        ids, slots, norms, terms = self._prepare()
+        count = len(ids)
+        scores = np.zeros(count, dtype=np.float32)
+        for term in set(tokenize(query)):
+            doc_slots, tf = self._term_arrays(term, slots, terms)
+            if not len(doc_slots):
+                continue
+            idf = math.log(1 + (count - len(doc_slots) + 0.5) / (len(doc_slots) + 0.5))
+            scores[doc_slots] += idf * tf * (self.k1 + 1) / (tf + norms[doc_slots])
+        matches = np.flatnonzero(scores)
+        if len(matches) > k:
+            matches = matches[np.argpartition(scores[matches], -k)[-k:]]
+        matches = matches[np.argsort(-scores[matches], kind="stable")]
+        return [(ids[slot], float(scores[slot])) for slot in matches]
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            pickle.dump((self.k1, self.b, self.docs), f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            k1, b, docs = pickle.load(f)
+        index = cls(k1, b)
+        index.docs = docs
+        for doc_id, (counts, length) in docs.items():
+            index.total_length += length
+            for term, count in counts.items():
+                index.postings[term][doc_id] = count
+        return index
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore):
+        index = cls()
+        ids = list(vectorstore.index_to_docstore_id.values())
+        index.add(ids, [vectorstore.docstore.search(i).page_content for i in ids])
+        return index
+
+
+@singleton
+def vector_pool():
+    return ThreadPoolExecutor(max_workers=8)
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] += 1 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class HybridRetriever(BaseRetriever):
+    """BM25 and FAISS results merged with reciprocal-rank fusion.
+
+    The vector search runs alongside the lexical one and is given
+    ``vector_timeout`` seconds. When it misses that, the lexical ranking is
+    returned alone, and for ``slow_cooldown`` seconds afterwards queries
+    skip the embedding call entirely.
+    """
+
+    vectorstore: object
+    lexical: BM25Index
+    k: int = 4
+    fetch_k: int = 20
+    rrf_k: int = 60
+    vector_timeout: float = 2.0
+    slow_cooldown: float = 60.0
+
+    _slow_until: float = PrivateAttr(default=0.0)
+
+    def with_embeddings(self, embeddings):
+        """The same retriever, embedding queries with ``embeddings``."""
+        from utils.vector_index import with_embeddings
+
+        return self.model_copy(
+            update={"vectorstore": with_embeddings(self.vectorstore, embeddings)}
+        )
+
+    def _vector_ids(self, query):
+        return [
+            doc.id
+            for doc in self.vectorstore.similarity_search(query, k=self.fetch_k)
+        ]
+
+    def _get_relevant_documents(
+        self, query, *, run_manager: CallbackManagerForRetrieverRun
+    ):
+        future = None
+        if time.monotonic() >= self._slow_until:
+            future = vector_pool().submit(self._vector_ids, query)
+        rankings = [[doc_id for doc_id, _ in self.lexical.search(query, self.fetch_k)]]
+        if future is not None:
+            try:
+                rankings.append(future.result(timeout=self.vector_timeout))
+            except Exception:
+                # Slow or failing embedding service, answer from BM25 alone
+                self._slow_until = time.monotonic() + self.slow_cooldown
+        docstore = self.vectorstore.docstore
+        return [
+            docstore.search(doc_id)
+            for doc_id in reciprocal_rank_fusion(rankings, self.rrf_k)[: self.k]
+        ]
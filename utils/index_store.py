@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+INDEX_DIR = Path("./.cache/indexes")
+
+
+def content_key(content, settings):
+    digest = hashlib.sha256(content)
+    digest.update(json.dumps(settings, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def index_path(key):
+    return INDEX_DIR / key
+
+
+def has_index(key):
+    path = index_path(key)
+    return (path / "index.faiss").exists() and (path / "index.pkl").exists()
+
+
+# Replaced versions are kept this long for readers still loading them
+STALE_VERSION_AGE = 60 * 60
+
+
+def current_version(key):
+    try:
+        return os.readlink(index_path(key))
+    except OSError:
+        return None
+
+
+def save_index(key, vectorstore, snapshot=None, lexical=None):
+    """Writes a new version of the index and points ``index_path(key)`` at it.
+
+    Each save goes to its own directory and is published by atomically
+    replacing a symlink, so readers always see a whole index. When another
+    writer publishes first, its version is kept and this one is dropped.
+    """
+    INDEX_DIR.mkdir(parents=True, exist_ok=True)
+    path = index_path(key)
+    previous = current_version(key)
+    version = Path(tempfile.mkdtemp(prefix=f"{key}.", dir=INDEX_DIR))
+    vectorstore.save_local(str(version))
+    if lexical is not None:
+        lexical.save(version / "bm25.pkl")
+    if snapshot is not None:
+        with open(version / "snapshot.json", "w") as f:
+            json.dump(snapshot, f)
+
+    if current_version(key) != previous:
+        shutil.rmtree(version, ignore_errors=True)
+        return
+    if path.is_dir() and not path.is_symlink():
+        # Saved before indexes were versioned
+        try:
+            os.replace(path, tempfile.mkdtemp(prefix=f"{key}.", dir=INDEX_DIR))
+        except FileNotFoundError:
+            pass
+    replaced = current_version(key)
+    link = path.with_name(f"{version.name}.link")
+    os.symlink(version.name, link)
+    os.replace(link, path)
+    if replaced:
+        # Stale from now on, not from when it was written
+        os.utime(INDEX_DIR / replaced)
+    remove_stale_versions(key)
+
+
+def remove_stale_versions(key):
+    current = current_version(key)
+    cutoff = time.time() - STALE_VERSION_AGE
+    for version in INDEX_DIR.glob(f"{key}.*"):
+        if version.name == current or version.is_symlink():
+            continue
+        try:
+            if version.stat().st_mtime < cutoff:
+                shutil.rmtree(version)
+        except FileNotFoundError:
+            # Another writer removed it first
+            pass
+
+
+def load_index(key, embeddings, mmap=True):
+    import faiss
+    from langchain_community.vectorstores import FAISS
+
+    # Both files must come from the same version, even if a new one is saved
+    path = index_path(key).resolve()
+    # IO_FLAG_MMAP only maps the inverted lists of IVF indexes (the large
+    # corpus IVF-PQ ones); Flat and SQfp16 codes are read into memory anyway.
+    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if mmap else 0
+    index = faiss.read_index(str(path / "index.faiss"), flags)
+    with open(path / "index.pkl", "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+
+def load_lexical(key, vectorstore):
+    from utils.hybrid import BM25Index
+
+    try:
+        return BM25Index.load(index_path(key) / "bm25.pkl")
+    except FileNotFoundError:
+        # Saved before the lexical index existed, rebuild it from the docstore
+        return BM25Index.from_vectorstore(vectorstore)
+
+
+def load_snapshot(key):
+    try:
+        with open(index_path(key) / "snapshot.json") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
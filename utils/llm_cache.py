@@ -0,0 +1,178 @@
+import hashlib
+import json
+import threading
+import time
+
+import numpy as np
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+
+from utils.db import connect
+from utils.registry import singleton
+
+LLM_CACHE_PATH = "./cache.db"
+
+
+def md5(text):
+    return hashlib.md5(text.encode()).hexdigest()
+
+
+def prompt_text(prompt):
+    # Chat models pass the serialized message list as the prompt; embed only
+    # the message contents so the JSON envelope doesn't dominate similarity.
+    try:
+        return "\n".join(
+            str(message["kwargs"]["content"]) for message in json.loads(prompt)
+        )
+    except (ValueError, TypeError, KeyError):
+        return prompt
+
+
+class ResponseCache(BaseCache):
+    """LLM response cache stored next to langchain's own tables in cache.db.
+
+    Lookups match the md5 of the rendered prompt exactly. With
+    ``embeddings`` set, a miss falls back to the most similar cached prompt
+    for the same model settings when its cosine similarity reaches
+    ``similarity_threshold``.
+    """
+
+    def __init__(
+        self,
+        path=LLM_CACHE_PATH,
+        ttl=7 * 24 * 60 * 60,
+        max_entries=20000,
+        embeddings=None,
+        similarity_threshold=0.95,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.embeddings = embeddings
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._pending_vectors = {}
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        with self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_response_cache (
+                    prompt_md5 TEXT NOT NULL,
+                    llm_md5 TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    embedding BLOB,
+                    created REAL NOT NULL,
+                    accessed REAL NOT NULL,
+                    PRIMARY KEY (prompt_md5, llm_md5)
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS llm_response_cache_accessed ON llm_response_cache (accessed)"
+            )
+
+    def _hit(self, prompt_md5, llm_md5, response):
+        with self._conn:
+            self._conn.execute(
+                "UPDATE llm_response_cache SET accessed = ? WHERE prompt_md5 = ? AND llm_md5 = ?",
+                (time.time(), prompt_md5, llm_md5),
+            )
+        return [loads(generation) for generation in json.loads(response)]
+
+    def _similar(self, llm_md5, vector, oldest):
+        rows = self._conn.execute(
+            "SELECT prompt_md5, response, embedding FROM llm_response_cache "
+            "WHERE llm_md5 = ? AND created >= ? AND embedding IS NOT NULL",
+            (llm_md5, oldest),
+        ).fetchall()
+        if not rows:
+            return None
+        matrix = np.frombuffer(b"".join(row[2] for row in rows), dtype=np.float32)
+        matrix = matrix.reshape(len(rows), -1)
+        scores = matrix @ vector / (
+            np.linalg.norm(matrix, axis=1) * np.linalg.norm(vector) + 1e-10
+        )
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            return None
+        return rows[best][0], rows[best][1]
+
+    def lookup(self, prompt, llm_string):
+        prompt_md5, llm_md5 = md5(prompt), md5(llm_string)
+        oldest = time.time() - self.ttl
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM llm_response_cache "
+                "WHERE prompt_md5 = ? AND llm_md5 = ? AND created >= ?",
+                (prompt_md5, llm_md5, oldest),
+            ).fetchone()
+            if row:
+                self.hits += 1
+                return self._hit(prompt_md5, llm_md5, row[0])
+
+        if self.embeddings is not None:
+            vector = np.asarray(
+                self.embeddings.embed_query(prompt_text(prompt)), dtype=np.float32
+            )
+            with self._lock:
+                if len(self._pending_vectors) > 1000:
+                    # Lookups whose call failed never reach update()
+                    self._pending_vectors.clear()
+                self._pending_vectors[(prompt_md5, llm_md5)] = vector
+                similar = self._similar(llm_md5, vector, oldest)
+                if similar:
+                    self.semantic_hits += 1
+                    return self._hit(similar[0], llm_md5, similar[1])
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def update(self, prompt, llm_string, return_val):
+        prompt_md5, llm_md5 = md5(prompt), md5(llm_string)
+        now = time.time()
+        with self._lock, self._conn:
+            vector = self._pending_vectors.pop((prompt_md5, llm_md5), None)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_response_cache VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    prompt_md5,
+                    llm_md5,
+                    json.dumps([dumps(generation) for generation in return_val]),
+                    vector.tobytes() if vector is not None else None,
+                    now,
+                    now,
+                ),
+            )
+            self._conn.execute(
+                "DELETE FROM llm_response_cache WHERE created < ?", (now - self.ttl,)
+            )
+            self._conn.execute(
+                """
+                DELETE FROM llm_response_cache WHERE rowid IN (
+                    SELECT rowid FROM llm_response_cache
+                    ORDER BY accessed DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+
+    def clear(self, **kwargs):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM llm_response_cache")
+
+    def stats(self):
+        lookups = self.hits + self.semantic_hits + self.misses
+        return {
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.semantic_hits) / lookups if lookups else 0.0,
+        }
+
+
+@singleton
+def llm_cache():
+    return ResponseCache()
@@ -0,0 +1,92 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from utils.registry import singleton
+from utils.splitter import TokenSplitter
+from utils.tokens import get_encoding
+
+PAGES_PER_TASK = 8
+
+
+@singleton
+def loader_pool():
+    # spawn instead of fork: the Streamlit server process is multi-threaded.
+    return ProcessPoolExecutor(
+        max_workers=max((os.cpu_count() or 2) - 1, 1),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=get_encoding,
+    )
+
+
+def _split(pages, file_path, splitter_settings):
+    from langchain.schema import Document
+
+    return TokenSplitter(**splitter_settings).split_documents(
+        [
+            Document(page_content=text, metadata={"source": file_path, "page": page})
+            for page, text in pages
+            if text.strip()
+        ]
+    )
+
+
+def _pdf_page_count(file_path):
+    from pdfminer.pdfpage import PDFPage
+
+    with open(file_path, "rb") as f:
+        return sum(1 for _ in PDFPage.get_pages(f))
+
+
+def _load_pdf_pages(file_path, start, stop, splitter_settings):
+    from pdfminer.high_level import extract_text
+
+    text = extract_text(file_path, page_numbers=range(start, stop))
+    # pdfminer ends every page with a form feed
+    pages = zip(range(start, stop), text.split("\f"))
+    return _split(pages, file_path, splitter_settings)
+
+
+def _load_file(file_path, splitter_settings):
+    from langchain.document_loaders import UnstructuredFileLoader
+
+    docs = UnstructuredFileLoader(file_path).load()
+    return _split(
+        [(0, doc.page_content) for doc in docs], file_path, splitter_settings
+    )
+
+
+def stream_chunks(file_path, splitter_settings, pages_per_task=PAGES_PER_TASK):
+    """Yields lists of chunks as each page range of the file finishes parsing.
+
+    PDFs are parsed in page ranges across the process pool, other files are
+    parsed whole in a single worker. Lists arrive in completion order; every
+    chunk carries its page number in ``metadata["page"]``.
+    """
+    pool = loader_pool()
+    if Path(file_path).suffix.lower() == ".pdf":
+        page_count = pool.submit(_pdf_page_count, file_path).result()
+        futures = [
+            pool.submit(
+                _load_pdf_pages,
+                file_path,
+                start,
+                min(start + pages_per_task, page_count),
+                splitter_settings,
+            )
+            for start in range(0, page_count, pages_per_task)
+        ]
+    else:
+        futures = [pool.submit(_load_file, file_path, splitter_settings)]
+    try:
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def load_chunks(file_path, splitter_settings):
+    chunks = [chunk for part in stream_chunks(file_path, splitter_settings) for chunk in part]
+    return sorted(chunks, key=lambda chunk: chunk.metadata["page"])
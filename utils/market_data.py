@@ -0,0 +1,387 @@
+import json
+import os
+import threading
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from utils.db import connect
+from utils.registry import singleton
+from utils.tokens import count_tokens
+
+MARKET_DATA_PATH = "./.cache/market_data.db"
+ALPHA_VANTAGE_URL = "https://www.alphavantage.co/query"
+DAY = 24 * 60 * 60
+
+INCOME_FIELDS = {
+    "totalRevenue": "revenue",
+    "grossProfit": "gross_profit",
+    "operatingIncome": "operating_income",
+    "netIncome": "net_income",
+    "ebitda": "ebitda",
+}
+INCOME_PERIODS = (("annual", "annualReports"), ("quarterly", "quarterlyReports"))
+OVERVIEW_FIELDS = (
+    "Symbol",
+    "Name",
+    "Sector",
+    "Industry",
+    "MarketCapitalization",
+    "PERatio",
+    "ForwardPE",
+    "PEGRatio",
+    "PriceToBookRatio",
+    "EPS",
+    "DividendYield",
+    "ProfitMargin",
+    "ReturnOnEquityTTM",
+    "QuarterlyRevenueGrowthYOY",
+    "QuarterlyEarningsGrowthYOY",
+    "AnalystTargetPrice",
+    "Beta",
+    "52WeekHigh",
+    "52WeekLow",
+)
+TOOL_TOKEN_BUDGET = 400
+
+
+def alpha_vantage(function, symbol):
+    from utils.http import get_json
+
+    return get_json(
+        ALPHA_VANTAGE_URL,
+        params={
+            "function": function,
+            "symbol": symbol,
+            "apikey": os.environ.get("ALPHA_VANTAGE_API_KEY"),
+        },
+    )
+
+
+def _payload(response, key):
+    if key not in response:
+        # Rate limits and bad symbols come back as a 200 with a message
+        raise ValueError(
+            response.get("Note") or response.get("Information") or str(response)
+        )
+    return response[key]
+
+
+class MarketDataStore:
+    """Per-symbol Alpha Vantage data kept in SQLite and refreshed incrementally.
+
+    ``fetch(function, symbol)`` returns the decoded API response; pass a
+    function that reads recorded responses to run without the network.
+    """
+
+    def __init__(self, path=MARKET_DATA_PATH, fetch=alpha_vantage):
+        self.fetch = fetch
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        with self._conn:
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS weekly_prices (
+                    symbol TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    open REAL, high REAL, low REAL, close REAL, volume REAL,
+                    PRIMARY KEY (symbol, date)
+                );
+                CREATE TABLE IF NOT EXISTS income (
+                    symbol TEXT NOT NULL,
+                    period TEXT NOT NULL,
+                    fiscal_date TEXT NOT NULL,
+                    revenue REAL, gross_profit REAL, operating_income REAL,
+                    net_income REAL, ebitda REAL,
+                    PRIMARY KEY (symbol, period, fiscal_date)
+                );
+                CREATE TABLE IF NOT EXISTS overviews (
+                    symbol TEXT PRIMARY KEY,
+                    data TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS refreshes (
+                    symbol TEXT NOT NULL,
+                    dataset TEXT NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    PRIMARY KEY (symbol, dataset)
+                );
+                """
+            )
+
+    def _fetched_at(self, symbol, dataset):
+        row = self._conn.execute(
+            "SELECT fetched_at FROM refreshes WHERE symbol = ? AND dataset = ?",
+            (symbol, dataset),
+        ).fetchone()
+        return row[0] if row else 0
+
+    def _latest(self, table, column, symbol):
+        row = self._conn.execute(
+            f"SELECT MAX({column}) FROM {table} WHERE symbol = ?", (symbol,)
+        ).fetchone()
+        return row[0]
+
+    def _refreshed(self, symbol, dataset):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO refreshes VALUES (?, ?, ?)",
+            (symbol, dataset, time.time()),
+        )
+
+    def _needs_refresh(self, symbol, dataset, latest, max_age_days):
+        if time.time() - self._fetched_at(symbol, dataset) < DAY:
+            return False
+        if latest is None:
+            return True
+        return date.fromisoformat(latest) < date.today() - timedelta(days=max_age_days)
+
+    def _fetch(self, function, symbol, key, latest):
+        try:
+            response = self.fetch(function, symbol)
+            _payload(response, key)
+            return response
+        except ValueError:
+            # Serve what is stored rather than fail the whole answer
+            if latest is None:
+                raise
+            return None
+
+    def refresh_weekly(self, symbol):
+        with self._lock:
+            latest = self._latest("weekly_prices", "date", symbol)
+            if not self._needs_refresh(symbol, "weekly", latest, 7):
+                return
+        response = self._fetch(
+            "TIME_SERIES_WEEKLY", symbol, "Weekly Time Series", latest
+        )
+        if response is None:
+            return
+        # Only weeks from the last stored one on are written; that last week's
+        # bar may have been stored before the week closed.
+        rows = [
+            (
+                symbol,
+                day,
+                float(bar["1. open"]),
+                float(bar["2. high"]),
+                float(bar["3. low"]),
+                float(bar["4. close"]),
+                float(bar["5. volume"]),
+            )
+            for day, bar in response["Weekly Time Series"].items()
+            if latest is None or day >= latest
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO weekly_prices VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._refreshed(symbol, "weekly")
+
+    def refresh_income(self, symbol):
+        with self._lock:
+            latest = self._latest("income", "fiscal_date", symbol)
+            # Quarterly reports land up to ~45 days after the quarter ends
+            if not self._needs_refresh(symbol, "income", latest, 90 + 45):
+                return
+        response = self._fetch("INCOME_STATEMENT", symbol, "quarterlyReports", latest)
+        if response is None:
+            return
+        rows = [
+            (symbol, period, report["fiscalDateEnding"])
+            + tuple(
+                float(pd.to_numeric(report.get(field), errors="coerce"))
+                for field in INCOME_FIELDS
+            )
+            for period, key in INCOME_PERIODS
+            for report in response.get(key, [])
+            # A fiscal year ends on its last quarter's date, so rewrite that one
+            if latest is None or report["fiscalDateEnding"] >= latest
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO income VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._refreshed(symbol, "income")
+
+    def refresh_overview(self, symbol):
+        with self._lock:
+            fetched_at = self._fetched_at(symbol, "overview")
+            if time.time() - fetched_at < DAY:
+                return
+        overview = self._fetch("OVERVIEW", symbol, "Symbol", fetched_at or None)
+        if overview is None:
+            return
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO overviews VALUES (?, ?)",
+                (symbol, json.dumps(overview)),
+            )
+            self._refreshed(symbol, "overview")
+
+    def weekly_prices(self, symbol):
+        symbol = symbol.strip().upper()
+        self.refresh_weekly(symbol)
+        with self._lock:
+            return pd.read_sql_query(
+                "SELECT date, open, high, low, close, volume FROM weekly_prices "
+                "WHERE symbol = ? ORDER BY date",
+                self._conn,
+                params=(symbol,),
+                parse_dates=["date"],
+                index_col="date",
+            )
+
+    def income(self, symbol, period="annual"):
+        symbol = symbol.strip().upper()
+        self.refresh_income(symbol)
+        with self._lock:
+            return pd.read_sql_query(
+                "SELECT fiscal_date, revenue, gross_profit, operating_income, "
+                "net_income, ebitda FROM income "
+                "WHERE symbol = ? AND period = ? ORDER BY fiscal_date",
+                self._conn,
+                params=(symbol, period),
+                parse_dates=["fiscal_date"],
+                index_col="fiscal_date",
+            )
+
+    def overview(self, symbol):
+        symbol = symbol.strip().upper()
+        self.refresh_overview(symbol)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM overviews WHERE symbol = ?", (symbol,)
+            ).fetchone()
+        return json.loads(row[0]) if row else {}
+
+
+def _round(value, digits=4):
+    return None if pd.isna(value) else round(float(value), digits)
+
+
+def price_summary(prices):
+    close = prices["close"]
+    last_year = close.iloc[-52:]
+    log_returns = np.log(last_year).diff().dropna()
+    summary = {
+        "last_close": _round(close.iloc[-1], 2),
+        "last_week": prices.index[-1].date().isoformat(),
+        "high_52w": _round(last_year.max(), 2),
+        "low_52w": _round(last_year.min(), 2),
+        "volatility_annualized": _round(log_returns.std() * np.sqrt(52)),
+        "max_drawdown_52w": _round((last_year / last_year.cummax() - 1).min()),
+        "avg_weekly_volume_13w": _round(prices["volume"].iloc[-13:].mean(), 0),
+    }
+    for label, weeks in (("1m", 4), ("3m", 13), ("6m", 26), ("1y", 52), ("5y", 260)):
+        if len(close) > weeks:
+            summary[f"return_{label}"] = _round(
+                close.iloc[-1] / close.iloc[-1 - weeks] - 1
+            )
+    return summary
+
+
+def income_summary(annual, quarterly):
+    summary = {}
+    if len(annual):
+        growth = annual[["revenue", "net_income"]].pct_change()
+        latest = annual.iloc[-1]
+        years = max(len(annual) - 1, 1)
+        summary.update(
+            {
+                "fiscal_year_end": annual.index[-1].date().isoformat(),
+                "revenue": _round(latest["revenue"], 0),
+                "net_income": _round(latest["net_income"], 0),
+                "revenue_growth_yoy": _round(growth["revenue"].iloc[-1]),
+                "net_income_growth_yoy": _round(growth["net_income"].iloc[-1]),
+                "revenue_cagr": _round(
+                    (annual["revenue"].iloc[-1] / annual["revenue"].iloc[0])
+                    ** (1 / years)
+                    - 1
+                ),
+                "gross_margin": _round(latest["gross_profit"] / latest["revenue"]),
+                "operating_margin": _round(
+                    latest["operating_income"] / latest["revenue"]
+                ),
+                "net_margin": _round(latest["net_income"] / latest["revenue"]),
+            }
+        )
+    if len(quarterly):
+        # Same quarter of the previous year, four rows back
+        growth = quarterly[["revenue", "net_income"]].pct_change(4)
+        summary.update(
+            {
+                "latest_quarter": quarterly.index[-1].date().isoformat(),
+                "quarter_revenue": _round(quarterly["revenue"].iloc[-1], 0),
+                "quarter_revenue_growth_yoy": _round(growth["revenue"].iloc[-1]),
+                "quarter_net_income_growth_yoy": _round(growth["net_income"].iloc[-1]),
+            }
+        )
+    return summary
+
+
+def overview_summary(overview):
+    return {
+        field: overview[field]
+        for field in OVERVIEW_FIELDS
+        if overview.get(field) not in (None, "None", "-")
+    }
+
+
+def price_table(prices, rows=13, step=4):
+    # Every fourth week back from the latest, oldest first
+    sampled = prices.iloc[::-step].iloc[:rows].iloc[::-1]
+    table = pd.DataFrame(
+        {
+            "close": sampled["close"].round(2),
+            "change": sampled["close"].pct_change().round(4),
+        }
+    )
+    table.index = table.index.strftime("%Y-%m-%d")
+    return table
+
+
+def income_table(income, rows=5, lag=1):
+    # lag=4 compares quarters with the same quarter a year earlier
+    growth = income["revenue"].pct_change(lag)
+    table = pd.DataFrame(
+        {
+            "revenue_m": (income["revenue"] / 1e6).round(1),
+            "net_income_m": (income["net_income"] / 1e6).round(1),
+            "revenue_yoy": growth.round(4),
+            "net_margin": (income["net_income"] / income["revenue"]).round(4),
+        }
+    ).iloc[-rows:]
+    table.index = table.index.strftime("%Y-%m-%d")
+    return table
+
+
+def compact(summary, tables=(), budget=TOOL_TOKEN_BUDGET):
+    """Renders key metrics and CSV tables in at most ``budget`` tokens.
+
+    Over budget, the oldest table rows go first, then trailing metrics.
+    """
+    lines = [f"{key}: {value}" for key, value in summary.items() if value is not None]
+    tables = [table for table in tables if len(table)]
+
+    def render():
+        return "\n".join(lines + [table.to_csv() for table in tables if len(table)])
+
+    text = render()
+    while count_tokens(text) > budget:
+        longest = max(range(len(tables)), key=lambda i: len(tables[i]), default=None)
+        if longest is not None and len(tables[longest]):
+            tables[longest] = tables[longest].iloc[1:]
+        elif lines:
+            lines.pop()
+        else:
+            break
+        text = render()
+    return text
+
+
+@singleton
+def market_data():
+    return MarketDataStore()
@@ -0,0 +1,72 @@
+import json
+import os
+import random
+import tempfile
+from pathlib import Path
+
+from utils.context import remove_overlap
+from utils.tokens import count_tokens
+
+QUIZ_BANK_DIR = Path("./.cache/quiz_bank")
+
+
+def context_windows(docs, max_tokens, max_windows=None):
+    windows, window, tokens = [], [], 0
+    for doc in docs:
+        # Adjacent chunks repeat chunk_overlap tokens of each other
+        text = remove_overlap(doc.page_content, window[-1:])
+        if not text:
+            continue
+        text_tokens = count_tokens(text)
+        if window and tokens + text_tokens > max_tokens:
+            windows.append("\n\n".join(window))
+            window, tokens = [], 0
+            text = doc.page_content
+            text_tokens = count_tokens(text)
+        window.append(text)
+        tokens += text_tokens
+    if window:
+        windows.append("\n\n".join(window))
+    if max_windows and len(windows) > max_windows:
+        # Spread the windows we keep over the whole document
+        step = len(windows) / max_windows
+        windows = [windows[int(i * step)] for i in range(max_windows)]
+    return windows
+
+
+def question_text(question):
+    return " ".join(question["question"].lower().split())
+
+
+def add_questions(questions, new):
+    """Appends the ``new`` questions not already asked in ``questions``.
+
+    Neighbouring windows share text, so they often produce the same question.
+    """
+    seen = {question_text(question) for question in questions}
+    for question in new:
+        text = question_text(question)
+        if text not in seen:
+            seen.add(text)
+            questions.append(question)
+
+
+def load_bank(key):
+    try:
+        with open(QUIZ_BANK_DIR / f"{key}.json") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_bank(key, bank):
+    QUIZ_BANK_DIR.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=f"{key}.", suffix=".tmp", dir=QUIZ_BANK_DIR)
+    with os.fdopen(fd, "w") as f:
+        json.dump(bank, f)
+    os.replace(tmp_path, QUIZ_BANK_DIR / f"{key}.json")
+
+
+def sample_quiz(bank, level, count=5):
+    questions = bank.get(level, [])
+    return random.sample(questions, min(count, len(questions)))
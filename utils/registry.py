@@ -0,0 +1,138 @@
+import functools
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+def singleton(factory):
+    """Calls the zero-argument ``factory`` once per process.
+
+    Unlike ``lru_cache``, concurrent first callers wait for the one instance
+    being built instead of each building (and keeping) their own.
+    """
+    lock = threading.Lock()
+    instances = []
+
+    @functools.wraps(factory)
+    def get():
+        if not instances:
+            with lock:
+                if not instances:
+                    instances.append(factory())
+        return instances[0]
+
+    return get
+
+
+def fingerprint(api_key):
+    # Keys are never stored, only enough of a digest to tell them apart
+    if not api_key:
+        return None
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+
+def config_hash(config):
+    return hashlib.sha1(
+        json.dumps(config, sort_keys=True, default=repr).encode()
+    ).hexdigest()
+
+
+class Registry:
+    """Process-wide objects shared by every session and rerun.
+
+    ``get`` builds ``factory()`` once per kind, config and API key; callers
+    asking for the same entry while it is being built wait for it instead
+    of building their own. Entries idle for ``ttl`` seconds, older than the
+    ``max_age`` they were requested with, or beyond ``max_entries`` (least
+    recently used first) are dropped.
+    """
+
+    def __init__(self, max_entries=64, ttl=6 * 60 * 60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._building = {}
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        for key, (_, created, used, max_age) in list(self._entries.items()):
+            if now - used > self.ttl or (max_age and now - created > max_age):
+                del self._entries[key]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _lookup(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries[key] = (entry[0], entry[1], now, entry[3])
+        self._entries.move_to_end(key)
+        return entry
+
+    def get(self, kind, config, factory, api_key=None, max_age=None):
+        key = (kind, config_hash(config), fingerprint(api_key))
+        with self._lock:
+            now = time.time()
+            self._evict(now)
+            entry = self._lookup(key, now)
+            if entry is not None:
+                return entry[0]
+            building = self._building.setdefault(key, threading.Lock())
+
+        with building:
+            with self._lock:
+                entry = self._lookup(key, time.time())
+            if entry is not None:
+                return entry[0]
+            try:
+                value = factory()
+            except BaseException:
+                with self._lock:
+                    self._building.pop(key, None)
+                raise
+            with self._lock:
+                now = time.time()
+                self._entries[key] = (value, now, now, max_age)
+                self._building.pop(key, None)
+                self._evict(now)
+            return value
+
+    def discard(self, kind, config, api_key=None):
+        with self._lock:
+            self._entries.pop((kind, config_hash(config), fingerprint(api_key)), None)
+
+
+@singleton
+def registry():
+    return Registry()
+
+
+def shared(kind, config, factory, api_key=None, max_age=None):
+    return registry().get(kind, config, factory, api_key=api_key, max_age=max_age)
+
+
+def chat_model(openai_api_key, **kwargs):
+    """A ChatOpenAI client shared by every caller with the same settings.
+
+    Callback handlers belong to a single session, so pass them per call
+    with ``config={"callbacks": [...]}`` rather than here.
+    """
+
+    def build():
+        from langchain_community.chat_models import ChatOpenAI
+        from utils.llm_cache import llm_cache
+
+        return ChatOpenAI(openai_api_key=openai_api_key, cache=llm_cache(), **kwargs)
+
+    return shared("chat_model", kwargs, build, api_key=openai_api_key)
+
+
+def openai_client(api_key, **kwargs):
+    def build():
+        from openai import OpenAI
+
+        return OpenAI(api_key=api_key, **kwargs)
+
+    return shared("openai_client", kwargs, build, api_key=api_key)
@@ -0,0 +1,72 @@
+import time
+
+FENCE = "```"
+
+
+def _freeze_point(text):
+    """End of the last complete paragraph in ``text`` outside a code fence."""
+    end = text.rfind("\n\n")
+    while end != -1:
+        if text.count(FENCE, 0, end) % 2 == 0:
+            return end + 2
+        end = text.rfind("\n\n", 0, end)
+    return 0
+
+
+class StreamRenderer:
+    """Renders a streamed message into a Streamlit container in coalesced steps.
+
+    Deltas are buffered and drawn at most every ``interval`` seconds, or once
+    ``max_pending`` characters are waiting. Completed paragraphs are frozen
+    into their own element, so each redraw only re-sends the paragraph still
+    being written instead of the whole message.
+    """
+
+    def __init__(self, container, interval=0.1, max_pending=400, transform=None):
+        self.container = container
+        self.interval = interval
+        self.max_pending = max_pending
+        self.transform = transform or (lambda text: text)
+        self.text = ""
+        self.renders = 0
+        self.bytes_sent = 0
+        self._frozen = 0
+        self._drawn = 0
+        self._last_draw = 0.0
+        self._box = container.empty()
+
+    def _draw(self, box, text):
+        text = self.transform(text)
+        box.markdown(text)
+        self.renders += 1
+        self.bytes_sent += len(text.encode())
+
+    def append(self, delta):
+        self.text += delta
+        if (
+            time.monotonic() - self._last_draw >= self.interval
+            or len(self.text) - self._drawn >= self.max_pending
+        ):
+            self.flush()
+
+    def flush(self):
+        if len(self.text) == self._drawn:
+            return
+        tail = self.text[self._frozen :]
+        point = _freeze_point(tail)
+        if point:
+            self._draw(self._box, tail[:point])
+            self._frozen += point
+            self._box = self.container.empty()
+            tail = tail[point:]
+        if tail:
+            self._draw(self._box, tail)
+        self._drawn = len(self.text)
+        self._last_draw = time.monotonic()
+
+    def close(self, text=None):
+        # Cached responses arrive whole, without any deltas
+        if text is not None and not self.text:
+            self.text = text
+        self.flush()
+        return self.text
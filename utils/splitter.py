@@ -0,0 +1,67 @@
+from bisect import bisect_left
+
+from langchain_text_splitters import TextSplitter
+
+from utils.tokens import DEFAULT_ENCODING, count_tokens, encode_with_offsets
+
+
+class TokenSplitter(TextSplitter):
+    """Splits on token offsets, tokenizing each text exactly once.
+
+    Chunks are cut at the last of ``separators`` (in order of preference)
+    that fits in ``chunk_size`` tokens, or mid-text when none does, so the
+    cost stays linear in the length of the document.
+    """
+
+    def __init__(
+        self,
+        separators=("\n\n", "\n", " "),
+        encoding_name=DEFAULT_ENCODING,
+        **kwargs,
+    ):
+        kwargs.setdefault(
+            "length_function", lambda text: count_tokens(text, encoding_name)
+        )
+        super().__init__(**kwargs)
+        self._separators = list(separators)
+        self._encoding_name = encoding_name
+
+    def _cut(self, text, low, high):
+        # Char position of the preferred separator boundary in text[low:high]
+        for separator in self._separators:
+            position = text.rfind(separator, low, high)
+            if position > low:
+                return position + len(separator)
+        return high
+
+    def _next_start(self, text, offsets, end):
+        # Start the overlap on a separator boundary rather than mid-word
+        start = end - self._chunk_overlap
+        for separator in self._separators:
+            position = text.find(separator, offsets[start], offsets[end])
+            if position != -1:
+                return bisect_left(offsets, position + len(separator), start, end)
+        return start
+
+    def split_text(self, text):
+        tokens, offsets = encode_with_offsets(text, self._encoding_name)
+        count = len(tokens)
+        offsets.append(len(text))
+
+        chunks = []
+        start = 0
+        while start < count:
+            end = min(start + self._chunk_size, count)
+            if end < count:
+                low = offsets[min(start + self._chunk_overlap, end - 1)]
+                cut = self._cut(text, low, offsets[end])
+                end = bisect_left(offsets, cut, start + 1, end)
+            chunk = text[offsets[start] : offsets[end]]
+            if self._strip_whitespace:
+                chunk = chunk.strip()
+            if chunk:
+                chunks.append(chunk)
+            if end >= count:
+                break
+            start = max(self._next_start(text, offsets, end), start + 1)
+        return chunks
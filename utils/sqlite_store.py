@@ -0,0 +1,111 @@
+import threading
+import time
+
+from langchain_core.stores import ByteStore
+
+from utils.db import chunked, connect
+
+
+class SQLiteStore(ByteStore):
+    """Byte store kept in a single SQLite file instead of one file per key.
+
+    Reads refresh an access timestamp and writes evict the least recently
+    used entries once the stored values exceed ``max_bytes``.
+    """
+
+    def __init__(self, path, max_bytes=None):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        with self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS kv (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    accessed REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS kv_accessed ON kv (accessed)"
+            )
+        self._size = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM kv"
+        ).fetchone()[0]
+
+    def mget(self, keys):
+        found = {}
+        with self._lock, self._conn:
+            for chunk in chunked(keys):
+                placeholders = ", ".join("?" * len(chunk))
+                found.update(
+                    self._conn.execute(
+                        f"SELECT key, value FROM kv WHERE key IN ({placeholders})",
+                        chunk,
+                    )
+                )
+            now = time.time()
+            self._conn.executemany(
+                "UPDATE kv SET accessed = ? WHERE key = ?",
+                [(now, key) for key in found],
+            )
+        return [found.get(key) for key in keys]
+
+    def mset(self, key_value_pairs):
+        now = time.time()
+        rows = [(key, value, len(value), now) for key, value in key_value_pairs]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO kv (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            # Replaced keys are counted twice until the next eviction recounts.
+            self._size += sum(row[2] for row in rows)
+            if self.max_bytes is not None and self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        self._conn.execute(
+            """
+            DELETE FROM kv WHERE key IN (
+                SELECT key FROM (
+                    SELECT key, SUM(size) OVER (
+                        -- rowid breaks ties within a batch stamped with one time
+                        ORDER BY accessed DESC, rowid DESC
+                        ROWS UNBOUNDED PRECEDING
+                    ) AS total
+                    FROM kv
+                ) WHERE total > ?
+            )
+            """,
+            (self.max_bytes,),
+        )
+        self._size = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM kv"
+        ).fetchone()[0]
+
+    def mdelete(self, keys):
+        with self._lock, self._conn:
+            for chunk in chunked(keys):
+                placeholders = ", ".join("?" * len(chunk))
+                self._size -= self._conn.execute(
+                    f"SELECT COALESCE(SUM(size), 0) FROM kv WHERE key IN ({placeholders})",
+                    chunk,
+                ).fetchone()[0]
+                self._conn.execute(
+                    f"DELETE FROM kv WHERE key IN ({placeholders})", chunk
+                )
+
+    def yield_keys(self, prefix=None):
+        with self._lock:
+            if prefix is None:
+                rows = self._conn.execute("SELECT key FROM kv").fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT key FROM kv WHERE substr(key, 1, ?) = ?",
+                    (len(prefix), prefix),
+                ).fetchall()
+        for (key,) in rows:
+            yield key
@@ -0,0 +1,81 @@
+import threading
+from functools import lru_cache
+
+DEFAULT_ENCODING = "cl100k_base"
+
+_lock = threading.Lock()
+_encodings = {}
+
+
+def get_encoding(name=DEFAULT_ENCODING):
+    encoding = _encodings.get(name)
+    if encoding is None:
+        with _lock:
+            encoding = _encodings.get(name)
+            if encoding is None:
+                # Imported here so prewarm() is cheap to import and call
+                import tiktoken
+
+                encoding = _encodings[name] = tiktoken.get_encoding(name)
+    return encoding
+
+
+def prewarm(names=(DEFAULT_ENCODING,)):
+    """Loads encodings in the background so the first split doesn't pay for it."""
+    if all(name in _encodings for name in names):
+        return
+
+    def load():
+        for name in names:
+            get_encoding(name)
+
+    threading.Thread(target=load, daemon=True).start()
+
+
+_offset_tables = {}
+
+
+def _offset_table(name):
+    # Per token id: the characters it starts, and whether its first byte
+    # continues a character begun by the previous token
+    table = _offset_tables.get(name)
+    if table is None:
+        import numpy as np
+
+        encoding = get_encoding(name)
+        pieces = []
+        for token in range(encoding.max_token_value + 1):
+            try:
+                pieces.append(encoding.decode_single_token_bytes(token))
+            except KeyError:
+                pieces.append(b"")
+        lengths = np.fromiter(map(len, pieces), dtype=np.int64, count=len(pieces))
+        raw = np.frombuffer(b"".join(pieces), dtype=np.uint8)
+        ends = np.cumsum(lengths)
+        char_starts = np.concatenate(([0], np.cumsum((raw & 0xC0) != 0x80)))
+        starts = char_starts[ends] - char_starts[ends - lengths]
+        first = raw[np.minimum(ends - lengths, len(raw) - 1)]
+        continues = ((lengths > 0) & ((first & 0xC0) == 0x80)).astype(np.int64)
+        table = _offset_tables[name] = (starts, continues)
+    return table
+
+
+def encode_with_offsets(text, encoding_name=DEFAULT_ENCODING):
+    """Tokens of ``text`` and the char offset each one starts at.
+
+    Same offsets as ``Encoding.decode_with_offsets``, which loops over every
+    byte in Python and was most of the cost of splitting a document.
+    """
+    import numpy as np
+
+    tokens = get_encoding(encoding_name).encode(text, disallowed_special=())
+    starts, continues = _offset_table(encoding_name)
+    ids = np.asarray(tokens, dtype=np.int64)
+    token_starts = starts[ids]
+    offsets = np.cumsum(token_starts) - token_starts - continues[ids]
+    return tokens, np.maximum(offsets, 0).tolist()
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text, encoding_name=DEFAULT_ENCODING):
+    return len(get_encoding(encoding_name).encode(text, disallowed_special=()))
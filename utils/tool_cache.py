@@ -0,0 +1,128 @@
+import functools
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+
+from utils.db import connect
+from utils.registry import singleton
+
+TOOL_CACHE_PATH = "./.cache/tools.db"
+
+
+def normalize(value, key=None, ignore_case=False):
+    if isinstance(value, dict):
+        return {k: normalize(v, k, ignore_case) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [normalize(v, ignore_case=ignore_case) for v in value]
+    if isinstance(value, str):
+        value = re.sub(r"\s+", " ", value).strip()
+        # Only for tools whose lookup ignores case; Wikipedia titles, URLs and
+        # symbols don't
+        return value.lower() if ignore_case and key == "query" else value
+    return value
+
+
+class ToolCache:
+    """Persistent tool results keyed by tool name and normalized arguments.
+
+    Concurrent calls with the same key share a single upstream call.
+    """
+
+    def __init__(self, path=TOOL_CACHE_PATH):
+        self.stats = defaultdict(lambda: {"hits": 0, "misses": 0, "coalesced": 0})
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        with self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS tool_results (
+                    key TEXT PRIMARY KEY,
+                    tool TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    created REAL NOT NULL
+                )
+                """
+            )
+
+    def _get(self, key, ttl):
+        row = self._conn.execute(
+            "SELECT result FROM tool_results WHERE key = ? AND created >= ?",
+            (key, time.time() - ttl),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _put(self, key, tool, result):
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO tool_results VALUES (?, ?, ?, ?)",
+                (key, tool, json.dumps(result), time.time()),
+            )
+
+    def call(self, tool, arguments, ttl, fn, cacheable=None, ignore_case=False):
+        arguments = normalize(arguments, ignore_case=ignore_case)
+        key = hashlib.sha256(
+            json.dumps([tool, arguments], sort_keys=True).encode()
+        ).hexdigest()
+        with self._lock:
+            result = self._get(key, ttl)
+            if result is not None:
+                self.stats[tool]["hits"] += 1
+                return result
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                self.stats[tool]["misses"] += 1
+            else:
+                self.stats[tool]["coalesced"] += 1
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            if cacheable is None or cacheable(result):
+                with self._lock:
+                    self._put(key, tool, result)
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+
+@singleton
+def tool_cache():
+    return ToolCache()
+
+
+def cached_tool(name, ttl, cacheable=None, ignore_case=False):
+    """Caches a tool function's JSON-serializable result for ``ttl`` seconds.
+
+    With ``ignore_case``, ``query`` arguments differing only in case share
+    an entry.
+    """
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return tool_cache().call(
+                name,
+                {"args": args, "kwargs": kwargs},
+                ttl,
+                lambda: fn(*args, **kwargs),
+                cacheable,
+                ignore_case,
+            )
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,174 @@
+import copy
+import math
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+# Exact search is fast enough below this many vectors
+FLAT_MAX_VECTORS = 20_000
+# fp16 codes halve memory with no measurable recall loss
+SQ_MAX_VECTORS = 200_000
+
+# Recall/latency knobs for the approximate indexes
+NPROBE = 16
+EF_SEARCH = 64
+HNSW_M = 32
+
+
+def index_spec(count, dim, hnsw=False):
+    """faiss.index_factory string for a corpus of ``count`` vectors."""
+    if count <= FLAT_MAX_VECTORS:
+        return "Flat"
+    if hnsw:
+        return f"HNSW{HNSW_M},SQfp16"
+    if count <= SQ_MAX_VECTORS:
+        return "SQfp16"
+    return ivf_spec(count, dim)
+
+
+def ivf_spec(count, dim):
+    # ~39 training points per centroid is the least k-means gets by with
+    nlist = max(1, min(int(4 * math.sqrt(count)), count // 39))
+    # 16 dimensions per sub-quantizer, 1 byte each: 1536 floats -> 96 bytes
+    m = next(m for m in range(max(dim // 16, 1), 0, -1) if dim % m == 0)
+    return f"IVF{nlist},PQ{m}"
+
+
+def spec_kind(spec):
+    for kind in ("IVF", "HNSW"):
+        if spec.startswith(kind):
+            return kind
+    return spec
+
+
+def index_kind(index):
+    if isinstance(index, faiss.IndexHNSW):
+        return "HNSW"
+    if isinstance(index, faiss.IndexIVF):
+        return "IVF"
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        return "SQfp16"
+    return "Flat"
+
+
+def tune(index, nprobe=NPROBE, ef_search=EF_SEARCH):
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = nprobe
+    elif isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search
+    return index
+
+
+def keeps_labels(index):
+    # IVF lists store the label each vector was added with and remove_ids
+    # leaves the others alone, unlike the flat codes the wrapper renumbers.
+    return isinstance(index, faiss.IndexIVF)
+
+
+def supports_remove(index):
+    # HNSW can't delete at all
+    return isinstance(index, faiss.IndexFlatCodes) or keeps_labels(index)
+
+
+def with_embeddings(vectorstore, embeddings):
+    """A view of ``vectorstore`` that embeds queries with ``embeddings``.
+
+    The index, docstore and id mapping are shared rather than copied.
+    """
+    view = copy.copy(vectorstore)
+    view.embedding_function = embeddings
+    return view
+
+
+def _build(embeddings, docs, ids, vectors, hnsw):
+    vectors = np.asarray(vectors, dtype=np.float32).reshape(len(docs), -1)
+    dim = vectors.shape[1] if len(docs) else 1
+    index = faiss.index_factory(dim, index_spec(len(docs), dim, hnsw))
+    if not index.is_trained:
+        index.train(vectors)
+    tune(index)
+    vectorstore = FAISS(embeddings, index, InMemoryDocstore(), {})
+    if docs:
+        vectorstore.add_embeddings(
+            zip([doc.page_content for doc in docs], vectors),
+            metadatas=[doc.metadata for doc in docs],
+            ids=list(ids),
+        )
+    return vectorstore
+
+
+def build(docs, embeddings, ids, hnsw=False):
+    """Embeds ``docs`` into a FAISS store whose index type fits their count."""
+    vectors = embeddings.embed_documents([doc.page_content for doc in docs])
+    return _build(embeddings, docs, ids, vectors, hnsw)
+
+
+def rebuild(vectorstore, exclude=(), hnsw=False):
+    # Vectors come back from the embedding cache rather than the index,
+    # where PQ codes only hold an approximation of them.
+    exclude = set(exclude)
+    ids = [
+        doc_id
+        for _, doc_id in sorted(vectorstore.index_to_docstore_id.items())
+        if doc_id not in exclude
+    ]
+    docs = [vectorstore.docstore.search(doc_id) for doc_id in ids]
+    return build(docs, vectorstore.embeddings, ids, hnsw)
+
+
+def add(vectorstore, docs, ids):
+    """Adds ``docs`` to a store built by ``build``, whatever its index type."""
+    if not keeps_labels(vectorstore.index):
+        vectorstore.add_documents(docs, ids=ids)
+        return vectorstore
+    from langchain_core.documents import Document
+
+    texts = [doc.page_content for doc in docs]
+    vectors = vectorstore.embeddings.embed_documents(texts)
+    # Past every label in use, since removals leave gaps rather than renumbering
+    start = max(vectorstore.index_to_docstore_id, default=-1) + 1
+    labels = np.arange(start, start + len(docs), dtype=np.int64)
+    vectorstore.index.add_with_ids(
+        np.asarray(vectors, dtype=np.float32).reshape(len(docs), -1), labels
+    )
+    vectorstore.docstore.add(
+        {
+            doc_id: Document(
+                id=doc_id, page_content=doc.page_content, metadata=doc.metadata
+            )
+            for doc_id, doc in zip(ids, docs)
+        }
+    )
+    vectorstore.index_to_docstore_id.update(zip(labels.tolist(), ids))
+    return vectorstore
+
+
+def remove(vectorstore, ids):
+    if not supports_remove(vectorstore.index):
+        hnsw = index_kind(vectorstore.index) == "HNSW"
+        return rebuild(vectorstore, exclude=ids, hnsw=hnsw)
+    if not keeps_labels(vectorstore.index):
+        vectorstore.delete(ids)
+        return vectorstore
+    ids = set(ids)
+    labels = [
+        label
+        for label, doc_id in vectorstore.index_to_docstore_id.items()
+        if doc_id in ids
+    ]
+    vectorstore.index.remove_ids(np.asarray(labels, dtype=np.int64))
+    vectorstore.docstore.delete(list(ids))
+    for label in labels:
+        del vectorstore.index_to_docstore_id[label]
+    return vectorstore
+
+
+def fit(vectorstore, hnsw=False):
+    """Rebuilds the index when the corpus has outgrown (or shrunk below) its type."""
+    index = vectorstore.index
+    wanted = index_spec(index.ntotal, index.d, hnsw)
+    if spec_kind(wanted) == index_kind(index):
+        return vectorstore
+    return rebuild(vectorstore, hnsw=hnsw)